@@ -10,6 +10,7 @@ Single source of truth for all chunking operations.
 """
 
 import os
+import threading
 from pathlib import Path
 from typing import List, Dict, Any
 
@@ -39,13 +40,12 @@ class LlamaChunker:
     def __init__(self):
         """Initialize LlamaIndex parsers"""
 
-        # Code parser (tree-sitter based, AST-aware)
-        self.code_splitter = CodeSplitter(
-            language="python",  # Updated per file
-            chunk_lines=50,
-            chunk_lines_overlap=15,
-            max_chars=2000
-        )
+        # Code parsers (tree-sitter based, AST-aware), one per language and per thread.
+        # A CodeSplitter's tree-sitter parser is bound to its language at construction and
+        # is not safe to share between threads, so splitters are created lazily per thread.
+        self._local = threading.local()
+        self._warm = False  # shared parsers exercised by warm_up()
+        self._warm_lock = threading.Lock()
 
         # Markdown parser (header-aware)
         self.markdown_parser = MarkdownNodeParser()
@@ -107,6 +107,19 @@ class LlamaChunker:
             print(f"Error reading {file_path}: {e}")
             return []
 
+        return self.chunk_text(content, file_path)
+
+    def chunk_text(self, content: str, file_path: str) -> List[str]:
+        """
+        Chunk already-read file content into semantic segments
+
+        Args:
+            content: File text
+            file_path: Path the text came from (selects the parser by extension)
+
+        Returns:
+            List of chunk strings (raw text content)
+        """
         if not content.strip():
             return []
 
@@ -215,8 +228,7 @@ class LlamaChunker:
         """
         if ext in self.code_exts and language:
             # Code-aware parsing (respects AST structure)
-            self.code_splitter.language = language
-            return self.code_splitter.get_nodes_from_documents([document])
+            return self._get_code_splitter(language).get_nodes_from_documents([document])
 
         elif ext in self.markdown_exts:
             # Markdown-aware parsing (respects headers)
@@ -244,6 +256,60 @@ class LlamaChunker:
             # Generic sentence-based parsing
             return self.sentence_splitter.get_nodes_from_documents([document])
 
+    def warm_up(self, extensions) -> None:
+        """
+        Build parser state for the given file extensions before the first file needs it
+
+        Code splitters are per thread, so each worker thread calls this once (e.g. as its
+        ThreadPoolExecutor initializer). The shared markdown/JSON/sentence parsers are
+        exercised once per instance so their lazy setup isn't paid by the first file.
+
+        Args:
+            extensions: File extensions (with dot) that are about to be chunked
+        """
+        for ext in set(extensions):
+            language = self.language_map.get(ext.lower(), '')
+            if not language:
+                continue
+            try:
+                self._get_code_splitter(language)
+            except Exception as e:
+                print(f"Could not prepare {language} splitter: {e}")
+
+        with self._warm_lock:
+            if self._warm:
+                return
+            self._warm = True
+        for ext in ('.md', '.json', '.txt'):
+            try:
+                self._parse_document(Document(text='{"warmup": true}'), ext, '')
+            except Exception:
+                pass
+
+    def _get_code_splitter(self, language: str) -> CodeSplitter:
+        """
+        Get this thread's CodeSplitter for a language, creating it on first use
+
+        Args:
+            language: Programming language (tree-sitter name)
+
+        Returns:
+            CodeSplitter bound to that language
+        """
+        splitters = getattr(self._local, 'code_splitters', None)
+        if splitters is None:
+            splitters = self._local.code_splitters = {}
+        splitter = splitters.get(language)
+        if splitter is None:
+            splitter = CodeSplitter(
+                language=language,
+                chunk_lines=50,
+                chunk_lines_overlap=15,
+                max_chars=2000
+            )
+            splitters[language] = splitter
+        return splitter
+
     def _classify_chunk_type(self, content: str, language: str) -> str:
         """
         Classify chunk type based on content
@@ -0,0 +1,513 @@
+"""
+Offline unit tests for chat/ingestion/vector_db_sync.py: its pure helpers and the sync pipeline.
+
+No API keys or network: the tokenizer is a stub, the Pinecone index is an in-memory fake,
+and chunking and embedding are stubbed out wherever the sync pipeline runs.
+
+Run (from repo root): python chat/ingestion/test_vectordb_sync_helpers.py
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from concurrent.futures import Future
+from pathlib import Path
+from unittest import mock
+
+THIS_DIR = Path(__file__).parent  # chat/ingestion/
+sys.path.insert(0, str(THIS_DIR))
+import vector_db_sync  # type: ignore
+
+
+class StubTokenizer:
+    """One token per 4 characters; decode() round-trips encode(), like tiktoken."""
+
+    def __init__(self):
+        self.encoded = 0  # texts sent through the BPE (encode + encode_batch)
+
+    def encode(self, text, allowed_special=None, **kwargs):
+        self.encoded += 1
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def encode_batch(self, texts, num_threads=1, allowed_special=None, **kwargs):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+class TokenizerTestCase(unittest.TestCase):
+    """Installs a fresh StubTokenizer and an empty token-count cache for each test."""
+
+    def setUp(self):
+        self.tokenizer = StubTokenizer()
+        patcher = mock.patch.object(vector_db_sync, "tokenizer", self.tokenizer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self._reset_token_cache()
+        self.addCleanup(self._reset_token_cache)
+
+    @staticmethod
+    def _reset_token_cache():
+        with vector_db_sync._token_cache_lock:
+            vector_db_sync._token_count_cache.clear()
+            vector_db_sync._token_cache_stats.update(hits=0, misses=0)
+
+
+class ReChunkIfOversizeTest(TokenizerTestCase):
+    def test_sections_within_limit_are_kept_stripped(self):
+        self.assertEqual(vector_db_sync.re_chunk_if_oversize(["  abcd  ", "\n\n", "efgh"], max_tokens=2),
+                         ["abcd", "efgh"])
+
+    def test_oversize_section_is_split_into_token_windows(self):
+        section = "".join(f"{i:04d}" for i in range(10))  # 10 tokens of 4 chars
+        pieces = vector_db_sync.re_chunk_if_oversize([section], max_tokens=3)
+        self.assertEqual(pieces, [section[0:12], section[12:24], section[24:36], section[36:40]])
+        self.assertEqual("".join(pieces), section)
+
+    def test_token_count_is_cached_for_produce_chunks(self):
+        vector_db_sync.re_chunk_if_oversize(["abcdefgh"], max_tokens=8)
+        encoded = self.tokenizer.encoded
+        self.assertEqual(vector_db_sync.count_tokens("abcdefgh"), 2)
+        self.assertEqual(self.tokenizer.encoded, encoded)
+
+
+class TokenCacheTest(TokenizerTestCase):
+    def test_batch_counts_deduplicate_and_hit_the_cache(self):
+        self.assertEqual(vector_db_sync.count_tokens_batch(["abcd", "abcdefgh", "abcd"]), [1, 2, 1])
+        self.assertEqual(self.tokenizer.encoded, 2)  # the repeated text is encoded once
+        self.assertEqual(vector_db_sync.count_tokens_batch(["abcdefgh"]), [2])
+        self.assertEqual(self.tokenizer.encoded, 2)
+        self.assertEqual(vector_db_sync._token_cache_stats["hits"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with mock.patch.object(vector_db_sync, "TOKEN_CACHE_SIZE", 2):
+            vector_db_sync.count_tokens_batch(["a", "bb"])
+            vector_db_sync.count_tokens("a")  # "a" is now the most recently used
+            vector_db_sync.count_tokens("ccc")  # evicts "bb"
+            self.assertEqual(vector_db_sync.count_tokens_batch(["a", "ccc"]), [1, 1])
+            encoded = self.tokenizer.encoded
+            vector_db_sync.count_tokens("bb")
+            self.assertEqual(self.tokenizer.encoded, encoded + 1)
+
+
+def _row(file_path: str, chunk_index: int, content: str) -> "vector_db_sync.ChunkRow":
+    meta = vector_db_sync.FileMeta(
+        repo_name="repo", file_path=file_path, file_type="md", chunk_type="content", should_embed=True,
+        status="A", commit_sha="sha", indexed_at="now", content_sha256="hash",
+    )
+    return vector_db_sync.ChunkRow(id=f"{file_path}#{chunk_index}", meta=meta, chunk_index=chunk_index,
+                                   content=content, line_range="L1-L1", token_count=1, values=[0.5])
+
+
+class IterBatchesTest(unittest.TestCase):
+    def test_count_limit(self):
+        rows = [_row("a.md", i, "x") for i in range(5)]
+        batches = list(vector_db_sync.iter_batches(rows, max_count=2, max_bytes=10 ** 6))
+        self.assertEqual([[row.chunk_index for row in batch] for batch, _ in batches], [[0, 1], [2, 3], [4]])
+        for batch, vectors in batches:
+            self.assertEqual([vector["id"] for vector in vectors], [row.id for row in batch])
+
+    def test_byte_limit(self):
+        rows = [_row("a.md", i, "x" * 300) for i in range(4)]
+        size = len(vector_db_sync._json_bytes(rows[0].to_vector()))
+        batches = list(vector_db_sync.iter_batches(rows, max_count=100, max_bytes=2 * size + size // 2))
+        self.assertEqual([len(batch) for batch, _ in batches], [2, 2])
+
+    def test_row_larger_than_limit_is_yielded_alone(self):
+        rows = [_row("a.md", 0, "x"), _row("a.md", 1, "y" * 1000), _row("a.md", 2, "z")]
+        batches = list(vector_db_sync.iter_batches(rows, max_count=100, max_bytes=500))
+        self.assertEqual([[row.chunk_index for row in batch] for batch, _ in batches], [[0], [1], [2]])
+
+
+class LineIndexTest(unittest.TestCase):
+    LINES = [
+        'x = "def f():"',  # contains the next line as a substring
+        "def f():",
+        "    return 1",
+        "}",
+        "def f():",
+        "  }  ",
+    ]
+
+    def setUp(self):
+        tmp = tempfile.NamedTemporaryFile(suffix=".py", delete=False)
+        tmp.write("\r\n".join(self.LINES).encode("utf-8"))
+        tmp.close()
+        self.path = Path(tmp.name)
+        self.addCleanup(self.path.unlink)
+
+    def test_build_line_index_maps_first_occurrence(self):
+        line_index = vector_db_sync.build_line_index(self.LINES)
+        self.assertEqual(line_index["def f():"], 2)
+        self.assertEqual(line_index["}"], 4)
+
+    def test_mmap_index_matches_whole_lines_only(self):
+        mmap_index = vector_db_sync.MmapLineIndex(self.path)
+        self.addCleanup(mmap_index.close)
+        self.assertEqual(mmap_index.get("def f():"), 2)
+        self.assertIsNone(mmap_index.get("return"))
+
+    def test_mmap_index_agrees_with_dict_from_the_top(self):
+        line_index = vector_db_sync.build_line_index(self.LINES)
+        for line in line_index:
+            if not line:
+                continue
+            mmap_index = vector_db_sync.MmapLineIndex(self.path)
+            self.addCleanup(mmap_index.close)
+            self.assertEqual(mmap_index.get(line), line_index[line], line)
+
+    def test_mmap_index_searches_forward_then_wraps(self):
+        mmap_index = vector_db_sync.MmapLineIndex(self.path)
+        self.addCleanup(mmap_index.close)
+        self.assertEqual(mmap_index.get("return 1"), 3)
+        self.assertEqual(mmap_index.get("def f():"), 5)  # next occurrence after the previous hit
+        self.assertEqual(mmap_index.get('x = "def f():"'), 1)  # earlier line: wraps to the top
+
+    def test_line_range(self):
+        line_index = vector_db_sync.build_line_index(self.LINES)
+        self.assertEqual(vector_db_sync.get_accurate_line_range("def f():\n    return 1\n", line_index), "L2-L3")
+        self.assertEqual(vector_db_sync.get_accurate_line_range("no such line", line_index), "L1-L1")
+
+
+class GithubEventFieldsTest(unittest.TestCase):
+    EVENT = {
+        "before": "a" * 40,
+        "after": "b" * 40,
+        "commits": [{"id": "c" * 40, "message": "x" * 1000}] * 50,
+        "pull_request": {"base": {"sha": "d" * 40}, "merge_commit_sha": None},
+    }
+
+    def setUp(self):
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        json.dump(self.EVENT, tmp)
+        tmp.close()
+        self.path = tmp.name
+        self.addCleanup(Path(self.path).unlink)
+        vector_db_sync._read_github_event_fields.cache_clear()
+        self.addCleanup(vector_db_sync._read_github_event_fields.cache_clear)
+
+    def _read(self, fields):
+        return vector_db_sync._read_github_event_fields(self.path, fields)
+
+    def test_push_fields(self):
+        self.assertEqual(self._read(vector_db_sync._GITHUB_EVENT_FIELDS["push"]),
+                         {"before": "a" * 40, "after": "b" * 40})
+
+    def test_pull_request_fields(self):
+        self.assertEqual(self._read(vector_db_sync._GITHUB_EVENT_FIELDS["pull_request"]),
+                         {"pull_request.base.sha": "d" * 40, "pull_request.merge_commit_sha": None})
+
+    def test_without_ijson(self):
+        with mock.patch.object(vector_db_sync, "ijson", None):
+            self.assertEqual(self._read(vector_db_sync._GITHUB_EVENT_FIELDS["pull_request"]),
+                             {"pull_request.base.sha": "d" * 40, "pull_request.merge_commit_sha": None})
+
+
+class ParseSubmoduleShortTest(unittest.TestCase):
+    def test_two_and_three_dot_ranges(self):
+        diff = "\n".join([
+            "Submodule team 1234567..89abcde:",
+            "Submodule lib/io 0000000...fedcba9 (new submodule)",
+            "diff --git a/README.md b/README.md",
+            "  Submodule nested abcdef0..1234567",
+        ])
+        self.assertEqual(vector_db_sync._parse_submodule_short(diff), [
+            ("team", "1234567", "89abcde"),
+            ("lib/io", "0000000", "fedcba9"),
+            ("nested", "abcdef0", "1234567"),
+        ])
+
+    def test_ignores_other_lines(self):
+        self.assertEqual(vector_db_sync._parse_submodule_short("Submodule team modified content\n+line"), [])
+
+
+class FakeIndex:
+    """In-memory stand-in for the Pinecone index, with the filter operators the sync uses."""
+
+    def __init__(self):
+        self.vectors = {}  # id -> metadata
+        self.upserts = []  # ids of every upsert() call, in order
+        self.deletes = []  # kwargs of every delete() call
+        self.rejected_ids = set()  # upserts carrying any of these fail as a malformed request would
+        self.fail_filter_deletes = False
+
+    @classmethod
+    def _matches(cls, metadata, flt):
+        for key, condition in flt.items():
+            if key == "$or":
+                if not any(cls._matches(metadata, clause) for clause in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = metadata.get(key)
+                if "$in" in condition and value not in condition["$in"]:
+                    return False
+                if "$gte" in condition and (value is None or value < condition["$gte"]):
+                    return False
+            elif metadata.get(key) != condition:
+                return False
+        return True
+
+    def upsert(self, vectors, namespace="", async_req=False):
+        ids = [vector["id"] for vector in vectors]
+        if self.rejected_ids.intersection(ids):
+            raise ValueError("invalid vector")
+        self.upserts.append(ids)
+        for vector in vectors:
+            self.vectors[vector["id"]] = vector["metadata"]
+        done = Future()
+        done.set_result({"upserted_count": len(vectors)})
+        return done
+
+    def delete(self, ids=None, filter=None, namespace="", delete_all=False):
+        if filter and self.fail_filter_deletes:
+            raise ValueError("delete failed")
+        self.deletes.append({"ids": ids, "filter": filter, "delete_all": delete_all})
+        if delete_all:
+            self.vectors.clear()
+        for vector_id in ids or []:
+            self.vectors.pop(vector_id, None)
+        if filter:
+            for vector_id in [i for i, md in self.vectors.items() if self._matches(md, filter)]:
+                del self.vectors[vector_id]
+
+    def fetch(self, ids, namespace=""):
+        return {"vectors": {i: {"id": i, "metadata": self.vectors[i]} for i in ids if i in self.vectors}}
+
+    def query(self, vector=None, top_k=10, filter=None, namespace="", **kwargs):
+        matches = [{"id": i, "metadata": md} for i, md in self.vectors.items() if self._matches(md, filter or {})]
+        return {"matches": matches[:top_k]}
+
+    def chunk_indexes(self, file_path):
+        return sorted(md["chunk_index"] for md in self.vectors.values() if md["file_path"] == file_path)
+
+
+class StubChunker:
+    def warm_up(self, extensions):
+        pass
+
+
+class PipelineTestCase(unittest.TestCase):
+    """
+    Runs SyncPipeline over files in a temp repo against a FakeIndex. produce_chunks is stubbed to
+    one chunk per line of the file, and embed_rows to a constant vector.
+    """
+
+    REPO = "repo"
+
+    def setUp(self):
+        self.index = FakeIndex()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        for name, value in {"index": self.index, "chunker": StubChunker(),
+                            "produce_chunks": self._produce_chunks, "embed_rows": self._embed_rows}.items():
+            patcher = mock.patch.object(vector_db_sync, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, file_path, chunks, version="v1"):
+        (self.root / file_path).write_text("".join(f"{version} chunk {i}\n" for i in range(chunks)), encoding="utf-8")
+
+    def sync(self, changes, manifest=None):
+        pipeline = vector_db_sync.SyncPipeline(changes, self.REPO, "sha", str(self.root),
+                                               str(self.root / "errors.jsonl"), manifest=manifest)
+        with mock.patch("sys.stdout"):
+            pipeline.run()
+        self.addCleanup(Path(pipeline.ids_path).unlink, missing_ok=True)
+        return pipeline
+
+    @staticmethod
+    def _produce_chunks(filepath, status, repo_name, commit_sha, repo_root=".", content_sha256="", raw=None,
+                        size=None):
+        meta = vector_db_sync.FileMeta(
+            repo_name=repo_name, file_path=filepath, file_type="md", chunk_type="content", should_embed=True,
+            status=status, commit_sha=commit_sha, indexed_at="now", content_sha256=content_sha256,
+        )
+        lines = (raw or (Path(repo_root) / filepath).read_bytes()).decode("utf-8").splitlines()
+        return [vector_db_sync.ChunkRow(id=vector_db_sync.chunk_vector_id(repo_name, filepath, i), meta=meta,
+                                        chunk_index=i, content=line, line_range=f"L{i + 1}-L{i + 1}", token_count=1)
+                for i, line in enumerate(lines)]
+
+    @staticmethod
+    def _embed_rows(rows):
+        for row in rows:
+            row.values = [0.5]
+            row.embedded = True
+
+
+class StageFailureTest(PipelineTestCase):
+    FILES = [f"f{i}.md" for i in range(5)]
+
+    def setUp(self):
+        super().setUp()
+        for file_path in self.FILES:
+            self.write(file_path, 3)
+        # One slot per queue: a stage that stopped draining its queue would block the stages before it
+        patcher = mock.patch.object(vector_db_sync, "PIPELINE_QUEUE_SIZE", 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _assert_all_failed(self, pipeline, stage):
+        self.assertEqual(len(pipeline.stage_errors), 1)
+        self.assertIn(f"{stage} stage failed", pipeline.stage_errors[0])
+        self.assertEqual(sorted({f["file_path"] for f in pipeline.failures}), self.FILES)
+        self.assertEqual(pipeline.done_files, len(self.FILES))
+
+    def test_upsert_stage_crash_fails_every_file(self):
+        with mock.patch.object(vector_db_sync, "iter_batches", side_effect=OSError("disk full")):
+            pipeline = self.sync([("A", file_path) for file_path in self.FILES])
+        self._assert_all_failed(pipeline, "upsert")
+        self.assertEqual(self.index.vectors, {})
+
+    def test_embed_stage_crash_fails_every_file(self):
+        with mock.patch.object(vector_db_sync, "embeddable_rows", side_effect=OSError("boom")):
+            pipeline = self.sync([("A", file_path) for file_path in self.FILES])
+        self._assert_all_failed(pipeline, "embed")
+        self.assertEqual(self.index.vectors, {})
+
+
+class ManifestTest(PipelineTestCase):
+    def _filter_deletes(self):
+        return [call for call in self.index.deletes if call["filter"]]
+
+    def test_save_and_load_round_trip(self):
+        path = str(self.root / "manifest.json")
+        self.assertEqual(vector_db_sync.load_manifest(path, "idx", "repo"), {})
+        vector_db_sync.save_manifest(path, "idx", "repo", {"a.md": 3})
+        vector_db_sync.save_manifest(path, "other-idx", "repo", {"a.md": 5})
+        vector_db_sync.save_manifest(path, "idx", "repo", {"a.md": 4, "b.md": 1})  # replaces its own entry only
+        self.assertEqual(vector_db_sync.load_manifest(path, "idx", "repo"), {"a.md": 4, "b.md": 1})
+        self.assertEqual(vector_db_sync.load_manifest(path, "other-idx", "repo"), {"a.md": 5})
+        self.assertEqual(vector_db_sync.load_manifest(path, "idx", "other-repo"), {})
+
+    def test_unreadable_manifest_loads_empty(self):
+        path = self.root / "manifest.json"
+        path.write_text("{not json", encoding="utf-8")
+        with mock.patch("sys.stdout"):
+            self.assertEqual(vector_db_sync.load_manifest(str(path), "idx", "repo"), {})
+
+    def test_shrunk_file_drops_tombstones_by_id(self):
+        self.write("a.md", 5)
+        self.assertEqual(self.sync([("A", "a.md")]).manifest_updates, {"a.md": 5})
+        self.write("a.md", 3, version="v2")
+        self.index.deletes.clear()
+        pipeline = self.sync([("M", "a.md")], manifest={"a.md": 5})
+        self.assertEqual(self.index.chunk_indexes("a.md"), [0, 1, 2])
+        self.assertEqual(self._filter_deletes(), [])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": 3})
+
+    def test_grown_file_needs_no_deletes(self):
+        self.write("a.md", 5)
+        self.sync([("A", "a.md")])
+        self.write("a.md", 8, version="v2")
+        self.index.deletes.clear()
+        pipeline = self.sync([("M", "a.md")], manifest={"a.md": 5})
+        self.assertEqual(self.index.chunk_indexes("a.md"), list(range(8)))
+        self.assertEqual(self.index.deletes, [])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": 8})
+
+    def test_stale_count_below_new_count_falls_back_to_filter_sweep(self):
+        # 10 chunks recorded in the manifest, then 20 written by a run without it, then 15 with it
+        self.write("a.md", 10)
+        self.sync([("A", "a.md")])
+        self.write("a.md", 20, version="v2")
+        self.sync([("M", "a.md")])
+        self.write("a.md", 15, version="v3")
+        pipeline = self.sync([("M", "a.md")], manifest={"a.md": 10})
+        self.assertEqual(self.index.chunk_indexes("a.md"), list(range(15)))
+        self.assertEqual(pipeline.manifest_updates, {"a.md": 15})
+        self.assertEqual(pipeline.failures, [])
+
+    def test_deleted_file_is_deleted_by_id(self):
+        self.write("a.md", 4)
+        self.sync([("A", "a.md")])
+        (self.root / "a.md").unlink()
+        self.index.deletes.clear()
+        pipeline = self.sync([("D", "a.md")], manifest={"a.md": 4})
+        self.assertEqual(self.index.chunk_indexes("a.md"), [])
+        self.assertEqual(self._filter_deletes(), [])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": None})
+        self.assertEqual(pipeline.deleted_files, 1)
+
+
+class ContentHashTest(PipelineTestCase):
+    def _head_id(self, file_path):
+        return vector_db_sync.chunk_vector_id(self.REPO, file_path, 0)
+
+    def test_unchanged_file_is_skipped(self):
+        self.write("a.md", 3)
+        self.sync([("A", "a.md")])
+        upserts = len(self.index.upserts)
+        pipeline = self.sync([("M", "a.md")])
+        self.assertEqual(pipeline.file_stats["unchanged"], 1)
+        self.assertEqual(len(self.index.upserts), upserts)
+
+    def test_chunk_zero_is_written_last(self):
+        self.write("a.md", 3)
+        pipeline = self.sync([("A", "a.md")])
+        self.assertEqual(self.index.upserts[-1], [self._head_id("a.md")])
+        self.assertEqual(self.index.chunk_indexes("a.md"), [0, 1, 2])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": 3})
+
+    def test_failed_file_loses_its_stale_chunk_zero_and_is_reindexed(self):
+        self.write("a.md", 3)
+        self.sync([("A", "a.md")])
+        self.write("a.md", 3, version="v2")
+        self.index.rejected_ids.add(vector_db_sync.chunk_vector_id(self.REPO, "a.md", 1))
+        pipeline = self.sync([("M", "a.md")])
+        self.assertEqual([f["file_path"] for f in pipeline.failures], ["a.md"])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": None})
+        # Chunk 0 still carried the v1 hash; left in place, a revert to v1 would be skipped
+        self.assertNotIn(self._head_id("a.md"), self.index.vectors)
+        self.index.rejected_ids.clear()
+        pipeline = self.sync([("M", "a.md")])
+        self.assertEqual((pipeline.file_stats["unchanged"], pipeline.failures), (0, []))
+        self.assertEqual(self.index.chunk_indexes("a.md"), [0, 1, 2])
+
+
+class TombstoneSweepTest(PipelineTestCase):
+    def _put(self, file_path, chunks, repo_name=PipelineTestCase.REPO):
+        for i in range(chunks):
+            self.index.vectors[vector_db_sync.chunk_vector_id(repo_name, file_path, i)] = {
+                "repo_name": repo_name, "file_path": file_path, "chunk_index": i}
+
+    def test_sweep_drops_chunks_past_each_count_in_one_request(self):
+        self._put("a.md", 5)
+        self._put("b.md", 3)
+        self._put("c.md", 2)
+        self._put("a.md", 5, repo_name="other")
+        vector_db_sync.sweep_stale_chunks([("a.md", 2), ("b.md", 3)], self.REPO)
+        self.assertEqual(len(self.index.deletes), 1)
+        self.assertEqual(self.index.chunk_indexes("a.md"), [0, 0, 1, 1, 2, 3, 4])  # other repo untouched
+        self.assertEqual(self.index.chunk_indexes("b.md"), [0, 1, 2])
+        self.assertEqual(self.index.chunk_indexes("c.md"), [0, 1])
+
+    def test_sweep_of_nothing_sends_no_request(self):
+        vector_db_sync.sweep_stale_chunks([], self.REPO)
+        self.assertEqual(self.index.deletes, [])
+
+    def test_shrunk_file_without_manifest_is_swept_by_filter(self):
+        self.write("a.md", 5)
+        self.sync([("A", "a.md")])
+        self.write("a.md", 2, version="v2")
+        self.index.deletes.clear()
+        pipeline = self.sync([("M", "a.md")])
+        self.assertEqual(self.index.chunk_indexes("a.md"), [0, 1])
+        self.assertEqual([call["ids"] for call in self.index.deletes], [None])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": 2})
+
+    def test_failed_sweep_fails_the_file(self):
+        self.write("a.md", 5)
+        self.sync([("A", "a.md")])
+        self.write("a.md", 2, version="v2")
+        self.index.fail_filter_deletes = True
+        pipeline = self.sync([("M", "a.md")])
+        self.assertEqual([(f["file_path"], f["message"]) for f in pipeline.failures], [("a.md", "delete failed")])
+        self.assertEqual(pipeline.manifest_updates, {"a.md": None})
+        self.assertEqual(self.index.chunk_indexes("a.md"), [1, 2, 3, 4])  # chunk 0 dropped: re-indexed next run
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,10 +14,26 @@ Invocation modes
   Wipes all vectors and re-indexes the entire repository from scratch.
 
 Behavior
-- A/M: pre-delete vectors for the path (idempotent), then chunk + embed + upsert
+- A/M: skip if the stored content_sha256 matches the file; otherwise chunk + embed + upsert.
+  Stored hashes are read from each file's chunk-0 vector, fetched by id for 100 files per call;
+  files without one are probed for older vectors with one $in query per group.
+  Chunk ids are deterministic (repo, path, chunk index), so upserts overwrite in place and
+  only chunks beyond the new chunk count are deleted afterwards (tombstone sweep, batched
+  into one filtered delete per SWEEP_FILES_PER_DELETE files at the end of the run)
+- Chunk 0 carries the hash the skip trusts, so it is written last: only after every other chunk
+  of the file landed and its sweep succeeded. A partly written file is re-indexed on the next run
 - D: delete vectors for the path
+- With --manifest, chunk counts written by earlier runs are kept in a sidecar file (one entry
+  per index, namespace and repo); deletes and sweeps for files it lists go out as delete-by-id
+  requests of up to 1000 ids instead of per-file metadata-filter deletes. A stale count (the
+  chunk after it still exists) falls back to the filter delete
 - Rename: expanded to D old + M new (superproject and submodules)
 - Embeddings are content-only; file path is stored in metadata
+- File reads run PREFETCH_FILES ahead of chunking on their own threads, so disk I/O overlaps
+  the chunk/embed/upsert work. Files indexed as a summary and files of MMAP_LINE_INDEX_MIN_BYTES
+  or more are not read ahead; they are hashed by streaming and chunked from disk
+- Chunking (SYNC_WORKERS threads), embedding and upserting run as overlapping pipeline
+  stages (bounded queues); upserts pack chunks from several files into each batch
 - Strict failure: unexpected errors fail the run; errors recorded to JSONL
 
 Env vars
@@ -27,27 +43,52 @@ Env vars
 - PINECONE_REGION (serverless; default: us-east-1)
 - PINECONE_ENV (classic fallback; default: us-west1-gcp)
 - PINECONE_INDEX (optional, default: repo-chunks)
+- PINECONE_TRANSPORT (optional, grpc or rest; default: grpc when pinecone[grpc] is installed)
+- SYNC_WORKERS (optional, files chunked in parallel; default: 4)
+- PINECONE_POOL_THREADS (optional, upsert requests in flight; default: 10)
+- PINECONE_UPSERT_BATCH (optional, vectors per upsert request; default: 100)
+- EMBED_BATCH_SIZE (optional, texts per Voyage request; default: 64)
+- EMBED_CONCURRENCY (optional, Voyage requests in flight on one asyncio loop; default: 4)
+- TIKTOKEN_CACHE_DIR (optional, BPE table cache; default: .tiktoken_cache next to this script)
 """
 
 # pyright: basic
 
+import asyncio
 import os
+import stat
 import sys
-import uuid
+import hashlib
+import bisect
+import functools
+import mmap
 import re
 import json
+import collections
+import queue
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, Iterator, List, Set, Tuple, Optional, Union
+import numpy as np
 import tiktoken
-from tqdm import tqdm
 import argparse
 import subprocess
+import tempfile
+from tqdm import tqdm
+from dataclasses import dataclass, field
 
 # LlamaIndex imports
 from llama_chunker import LlamaChunker
 from llama_index.embeddings.voyageai import VoyageEmbedding
 
+# Keep tiktoken's BPE tables in a stable on-disk cache so runs (and CI caches) skip the download
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(Path(__file__).resolve().parent / ".tiktoken_cache"))
+
 # Constants
 MAX_TOKENS = 8192
 INDEX_NAME = "repo-chunks"
@@ -56,7 +97,29 @@ GIT_EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"  # Git's empty tree
 EMBEDDING_MODEL = "voyage-code-3"  # SOTA code embedding model
 DIMENSION = 1024  # voyage-code-3 dimension
 METRIC = "cosine"
-BATCH_SIZE = 10
+BATCH_SIZE = int(os.environ.get("PINECONE_UPSERT_BATCH", "100"))  # vectors per Pinecone upsert request
+UPSERT_MAX_BYTES = 1_800_000  # Pinecone rejects upsert requests over 2MB; leave headroom for the request envelope
+PINECONE_POOL_THREADS = int(os.environ.get("PINECONE_POOL_THREADS", "10"))  # concurrent async_req upserts
+UPSERT_TIMEOUT_SECONDS = 60  # max wait for one upsert request to be acknowledged
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))  # texts per Voyage request
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))  # Voyage requests in flight
+EMBED_MAX_RETRIES = 5  # retries per batch on rate limiting (429)
+PINECONE_MAX_RETRIES = 5  # retries per upsert/delete on 429, 5xx, timeouts and dropped connections
+EMBED_FLUSH_ROWS = EMBED_BATCH_SIZE * EMBED_CONCURRENCY  # chunks gathered across files per embedding flush
+EMBED_FLUSH_SECONDS = 0.5  # flush a partial embedding group after this long without new files
+PIPELINE_QUEUE_SIZE = 32  # files buffered between the chunk, embed and upsert stages
+SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS", "4"))  # threads chunking files (and deleting vectors)
+PROGRESS_LOG_SECONDS = 60  # interval of the progress/ETA log line
+MMAP_LINE_INDEX_MIN_BYTES = 256 * 1024  # files at least this big use MmapLineIndex for line ranges
+TOKEN_CACHE_SIZE = 20000  # distinct chunk texts whose token counts are remembered (LRU)
+SWEEP_FILES_PER_DELETE = 100  # files per $or clause in one tombstone-sweep delete
+PREFETCH_FILES = 8  # files read from disk ahead of the chunk workers
+STORED_SHA_FETCH_BATCH = 100  # files whose chunk-0 vector is fetched per Pinecone fetch call
+STORED_SHA_PROBE_TOP_K = 1000  # matches per query probing files without chunk 0 (Pinecone's cap with metadata)
+DELETE_IDS_BATCH = 1000  # ids per delete-by-id request (Pinecone's limit)
+
+# `git diff --submodule=short` may use either `..` or `...` between SHAs.
+_SUBMODULE_SHORT_RE = re.compile(r"^Submodule\s+([^\s]+)\s+([0-9a-f]{7,})\.{2,3}([0-9a-f]{7,}).*$")
 
 # Extensions we should not attempt to parse/chunk as text. We index them as a single metadata summary.
 # This avoids embedding binary gibberish (images, archives, etc.) which is slow and error-prone.
@@ -100,6 +163,18 @@ SUMMARY_ONLY_BASENAMES = {
     "composer.lock",
 }
 
+# orjson is optional: a faster drop-in for our JSON encoding and decoding (see _json_bytes/_loads)
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
+# ijson is optional: lets us read a few fields from the GitHub event file without parsing all of it
+try:
+    import ijson  # type: ignore
+except Exception:
+    ijson = None  # type: ignore
+
 # Prefer serverless Pinecone SDK; fallback to classic client if not available
 USE_SERVERLESS = False
 pc = None  # type: ignore
@@ -117,18 +192,162 @@ except Exception:
         pinecone_client = None  # type: ignore
         USE_SERVERLESS = False
 
+# gRPC transport (pinecone[grpc]) is optional: HTTP/2 + protobuf upserts, falls back to REST
+try:
+    from pinecone.grpc import PineconeGRPC, GRPCClientConfig  # type: ignore
+except Exception:
+    PineconeGRPC = None  # type: ignore
+    GRPCClientConfig = None  # type: ignore
+PINECONE_TRANSPORT = os.environ.get("PINECONE_TRANSPORT", "grpc").strip().lower()
+
 # Clients are initialized in main() to avoid import-time failures
 index = None
 embed_model = None  # VoyageEmbedding instance
 tokenizer = None
 chunker = None  # LlamaChunker instance
+_embed_loop = None  # asyncio loop (own thread) running concurrent embedding batches (created on first use)
+_embed_loop_lock = threading.Lock()
+# Token counts keyed by blake2b digest of the text; duplicate chunks (license headers, vendored or
+# generated files) skip tiktoken entirely. Shared by the chunk workers, hence the lock.
+_token_count_cache: "collections.OrderedDict[bytes, int]" = collections.OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {"hits": 0, "misses": 0}
+# Retries per operation ("embed", "upsert", "delete") since the start of run_sync, for the summary
+_retry_stats: "collections.Counter[str]" = collections.Counter()
+_retry_stats_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class FileMeta:
+    """Metadata shared by every chunk of one file (stored once per file, not per chunk)."""
+    repo_name: str
+    file_path: str
+    file_type: str
+    chunk_type: str
+    should_embed: bool
+    status: str
+    commit_sha: str
+    indexed_at: str
+    content_sha256: str
+    base: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Built once per file and merged into every chunk's metadata by ChunkRow.to_vector()
+        self.base = {
+            "repo_name": self.repo_name,
+            "file_path": self.file_path,
+            "file_type": self.file_type,
+            "chunk_type": self.chunk_type,
+            "should_embed": self.should_embed,
+            "status": self.status,
+            "commit_sha": self.commit_sha,
+            "indexed_at": self.indexed_at,
+            "content_sha256": self.content_sha256,
+        }
+
+
+@dataclass(slots=True)
+class ChunkRow:
+    """One chunk staged for upsert; expanded to Pinecone's dict shape only at upsert time."""
+    id: str
+    meta: FileMeta
+    chunk_index: int
+    content: str
+    line_range: str
+    token_count: int
+    values: List[float] = field(default_factory=list)
+    embedded: bool = False
+
+    def to_vector(self) -> dict:
+        return {
+            "id": self.id,
+            "values": self.values,
+            "metadata": {
+                **self.meta.base,
+                "chunk_index": self.chunk_index,
+                "chunk_id": self.id,
+                "content": self.content,
+                "line_range": self.line_range,
+                "embedded": self.embedded,
+                "token_count": self.token_count,
+            },
+        }
+
+
+def _json_bytes(obj) -> bytes:
+    """Compact UTF-8 JSON, via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _dumps(obj) -> str:
+    return _json_bytes(obj).decode("utf-8")
+
+
+def _loads(data: Union[bytes, str]):
+    """Parse JSON text or UTF-8 bytes, via orjson when installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def _cached_token_count(key: bytes) -> Optional[int]:
+    with _token_cache_lock:
+        count = _token_count_cache.get(key)
+        if count is None:
+            _token_cache_stats["misses"] += 1
+            return None
+        _token_count_cache.move_to_end(key)
+        _token_cache_stats["hits"] += 1
+        return count
+
+
+def _store_token_count(key: bytes, count: int) -> None:
+    with _token_cache_lock:
+        _token_count_cache[key] = count
+        _token_count_cache.move_to_end(key)
+        while len(_token_count_cache) > TOKEN_CACHE_SIZE:
+            _token_count_cache.popitem(last=False)
 
 
 def count_tokens(text: str) -> int:
+    return count_tokens_batch([text])[0]
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """
+    Token counts for many texts in one call. Counts already in the cache are reused; the rest
+    (deduplicated) go to tiktoken in one encode_batch, which runs the BPE across threads without the GIL.
+    """
     if tokenizer is None:
         # Should not happen (tokenizer initialized in main) but be safe
-        return len(text.split())
-    return len(tokenizer.encode(text, allowed_special="all"))
+        return [len(text.split()) for text in texts]
+    if not texts:
+        return []
+    counts: List[Optional[int]] = [None] * len(texts)
+    missing: Dict[bytes, List[int]] = {}
+    for i, text in enumerate(texts):
+        key = _text_key(text)
+        if key in missing:
+            missing[key].append(i)
+            continue
+        counts[i] = _cached_token_count(key)
+        if counts[i] is None:
+            missing[key] = [i]
+    if missing:
+        keys = list(missing)
+        encoded = tokenizer.encode_batch([texts[missing[key][0]] for key in keys],
+                                         num_threads=os.cpu_count() or 1, allowed_special="all")
+        for key, tokens in zip(keys, encoded):
+            _store_token_count(key, len(tokens))
+            for i in missing[key]:
+                counts[i] = len(tokens)
+    return counts
 
 
 def re_chunk_if_oversize(sections: List[str], max_tokens: int = MAX_TOKENS) -> List[str]:
@@ -138,38 +357,37 @@ def re_chunk_if_oversize(sections: List[str], max_tokens: int = MAX_TOKENS) -> L
         if not section:
             continue
 
-        tokens = count_tokens(section)
-        if tokens <= max_tokens:
+        if tokenizer is None:
+            # Should not happen (tokenizer initialized in main); nothing to slice on
             final_chunks.append(section)
-        else:
-            split_points = re.split(r'(?<=[.!?])\s+', section)
-            current_chunk = ""
+            continue
 
-            for part in split_points:
-                test_chunk = current_chunk + (" " + part if current_chunk else part)
-                if count_tokens(test_chunk) <= max_tokens:
-                    current_chunk = test_chunk
-                else:
-                    if current_chunk:
-                        final_chunks.append(current_chunk.strip())
-                    current_chunk = part
+        key = _text_key(section)
+        cached = _cached_token_count(key)
+        if cached is not None and cached <= max_tokens:
+            final_chunks.append(section)
+            continue
 
-            if current_chunk.strip():
-                final_chunks.append(current_chunk.strip())
+        token_ids = tokenizer.encode(section, allowed_special="all")
+        if cached is None:
+            # produce_chunks counts the same text again; this makes that a cache hit
+            _store_token_count(key, len(token_ids))
+        if len(token_ids) <= max_tokens:
+            final_chunks.append(section)
+            continue
 
-            really_final: List[str] = []
-            for chunk in final_chunks:
-                if count_tokens(chunk) <= max_tokens:
-                    really_final.append(chunk)
-                else:
-                    char_chunks = re.findall(r'.{1,3000}(?:\s+|$)', chunk)
-                    really_final.extend([s.strip() for s in char_chunks if s.strip()])
-            final_chunks = really_final
+        # Slice directly on token ids: exact max_tokens windows in one pass, no regex backtracking.
+        for start_tok in range(0, len(token_ids), max_tokens):
+            piece = tokenizer.decode(token_ids[start_tok:start_tok + max_tokens]).strip()
+            if piece:
+                final_chunks.append(piece)
 
     return final_chunks
 
 
+@functools.lru_cache(maxsize=65536)
 def detect_file_type(filepath: str) -> str:
+    # Cached per path so shebang files are opened once per run (cleared at the start of run_sync).
     path = Path(filepath)
     ext = path.suffix.lower()
 
@@ -212,13 +430,16 @@ First 20 lines preview:
         return [f"Error reading CSV {filepath}: {e}"], True
 
 
-def chunk_as_summary(filepath: Path):
+def chunk_as_summary(filepath: Path, known_type: Optional[str] = None, size: Optional[int] = None):
+    # Callers that already know the type (from the extension) or the size (from an earlier stat)
+    # pass them in so no shebang sniff or extra stat() is needed.
     path = Path(filepath)
-    file_type = detect_file_type(str(filepath))
+    file_type = known_type if known_type is not None else detect_file_type(str(filepath))
 
     try:
-        stat = path.stat()
-        size_mb = stat.st_size / (1024 * 1024)
+        if size is None:
+            size = path.stat().st_size
+        size_mb = size / (1024 * 1024)
 
         summary = f"""{file_type.upper()} file: {path.name}
 Path: {filepath}
@@ -239,19 +460,45 @@ Type: {file_type}
         return [f"Error accessing {filepath}: {e}"], True
 
 
-def dispatch_chunking(filepath: Path):
-    """Simplified chunking - LlamaIndex replaces all custom AST parsing"""
+def _summary_by_name(path: Path) -> bool:
+    """True if dispatch_chunking indexes the file as a summary/preview, decided by its name alone."""
+    ext = path.suffix.lower()
+    return path.name.lower() in SUMMARY_ONLY_BASENAMES or ext in BINARY_EXTS or ext in {".csv", ".tsv"}
+
+
+def _read_for_chunking(path: Path) -> Optional[bytes]:
+    """
+    The file's bytes for in-memory chunking, or None if it is better chunked from disk: summary
+    files never need their content, and files of MMAP_LINE_INDEX_MIN_BYTES or more get their line
+    ranges from a memory map, so a full copy in memory would only cost RAM.
+    """
+    if _summary_by_name(path):
+        return None
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_LINE_INDEX_MIN_BYTES:
+            return None
+        return f.read()
+
+
+def dispatch_chunking(filepath: Path, size: Optional[int] = None, text: Optional[str] = None):
+    """
+    Simplified chunking - LlamaIndex replaces all custom AST parsing
+
+    `text` is the file's already-read content; when given, content chunking uses it instead of
+    reading the file again.
+    """
     path = Path(filepath)
     ext = path.suffix.lower()
 
     # Lockfiles and similar artifacts: index as a single summary chunk.
+    # Both cases are decided by name alone, so the type is the extension (no shebang sniff).
     if path.name.lower() in SUMMARY_ONLY_BASENAMES:
-        chunks, _ = chunk_as_summary(path)
+        chunks, _ = chunk_as_summary(path, known_type=ext.lstrip('.'), size=size)
         return chunks, True, "summary"
 
     # Binary-ish assets: index a single summary chunk instead of trying to parse/chunk file bytes as text.
     if ext in BINARY_EXTS:
-        chunks, _ = chunk_as_summary(path)
+        chunks, _ = chunk_as_summary(path, known_type=ext.lstrip('.'), size=size)
         return chunks, True, "summary"
 
     # CSV/TSV: simple preview (no pandas needed)
@@ -264,7 +511,7 @@ def dispatch_chunking(filepath: Path):
     #                     json, yaml, yml, ipynb (structured data)
     #                     html, css, xml (markup)
     try:
-        chunks = chunker.chunk_file(str(filepath))
+        chunks = chunker.chunk_file(str(filepath)) if text is None else chunker.chunk_text(text, str(filepath))
         if chunks:
             # Some formats (large JSON, lockfiles) can still exceed our embed token limit.
             # Re-chunk defensively so we never upsert empty embeddings.
@@ -273,129 +520,436 @@ def dispatch_chunking(filepath: Path):
         print(f"LlamaChunker error for {filepath}: {e}")
 
     # Fallback: unsupported files get metadata summary
-    chunks, _ = chunk_as_summary(path)
+    chunks, _ = chunk_as_summary(path, size=size)
     return chunks, True, "summary"
 
 
-def get_embedding(text: str) -> List[float]:
-    """Generate embedding using Voyage AI's voyage-code-3 model"""
-    if not text or not text.strip():
-        raise RuntimeError("Empty text provided for embedding")
-    try:
-        # Use LlamaIndex VoyageEmbedding - get_text_embedding for documents
-        embedding = embed_model.get_text_embedding(text)
+def _validate_embeddings(embeddings: List[List[float]]) -> List[List[float]]:
+    for embedding in embeddings:
         if not embedding:
             raise RuntimeError("Received empty embedding from API")
         if len(embedding) != DIMENSION:
             raise RuntimeError(
                 f"Unexpected embedding dimension: got {len(embedding)}, expected {DIMENSION}"
             )
-        # Pinecone rejects NaN/inf; fail early with a clear message.
-        for v in embedding:
-            if v != v or v == float("inf") or v == float("-inf"):
-                raise RuntimeError("Embedding contains NaN/inf values")
-        return embedding
+    # Pinecone rejects NaN/inf; fail early with a clear message. One vectorized pass over the whole batch.
+    if embeddings and not np.isfinite(np.asarray(embeddings, dtype=np.float64)).all():
+        raise RuntimeError("Embedding contains NaN/inf values")
+    return embeddings
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    return getattr(e, "http_status", None) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _is_transient(e: Exception) -> bool:
+    """Errors worth retrying on Pinecone calls: rate limits, 5xx, timeouts and dropped connections."""
+    if _is_rate_limited(e):
+        return True
+    status = getattr(e, "http_status", None) or getattr(e, "status", None)
+    if isinstance(status, int) and (status == 429 or 500 <= status < 600):
+        return True
+    # gRPC transport: status codes instead of HTTP statuses
+    code = getattr(e, "code", None)
+    if callable(code):
+        try:
+            if getattr(code(), "name", "") in {"UNAVAILABLE", "RESOURCE_EXHAUSTED", "DEADLINE_EXCEEDED"}:
+                return True
+        except Exception:
+            pass
+    # multiprocessing's TimeoutError (AsyncResult.get) and urllib3's errors don't subclass the builtins
+    return isinstance(e, (ConnectionError, TimeoutError)) or \
+        type(e).__name__ in {"TimeoutError", "MaxRetryError", "ProtocolError"}
+
+
+def _retry_after_seconds(e: Exception) -> Optional[float]:
+    headers = getattr(e, "headers", None) or {}
+    try:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _call_with_backoff(fn, *args, retries: int = EMBED_MAX_RETRIES, initial: float = 1.0, max_delay: float = 30.0,
+                       retryable=_is_rate_limited, label: str = "embed"):
+    """
+    Call fn(*args), retrying errors accepted by `retryable` (rate limits by default) with exponential
+    backoff + jitter; a 429's Retry-After is honored. Retries are counted under `label`.
+    """
+    delay = initial
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt >= retries or not retryable(e):
+                raise
+            time.sleep(_backoff_wait(e, delay, attempt, retries, label))
+            delay = min(delay * 2, max_delay)
+
+
+async def _acall_with_backoff(fn, *args, retries: int = EMBED_MAX_RETRIES, initial: float = 1.0,
+                              max_delay: float = 30.0, retryable=_is_rate_limited, label: str = "embed"):
+    """Async twin of _call_with_backoff: awaits fn(*args) and backs off with asyncio.sleep."""
+    delay = initial
+    for attempt in range(retries + 1):
+        try:
+            return await fn(*args)
+        except Exception as e:
+            if attempt >= retries or not retryable(e):
+                raise
+            await asyncio.sleep(_backoff_wait(e, delay, attempt, retries, label))
+            delay = min(delay * 2, max_delay)
+
+
+def _backoff_wait(e: Exception, delay: float, attempt: int, retries: int, label: str) -> float:
+    """Seconds to wait before the next attempt (Retry-After, else delay + jitter); counts and logs the retry."""
+    wait = _retry_after_seconds(e)
+    if wait is None:
+        wait = delay + random.uniform(0, delay * 0.1)
+    with _retry_stats_lock:
+        _retry_stats[label] += 1
+    print(f"[warn] {label} failed ({e.__class__.__name__}); retrying in {wait:.1f}s ({attempt + 1}/{retries})")
+    return wait
+
+
+def _get_embed_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop on a daemon thread that runs embedding requests. One long-lived loop (rather than
+    asyncio.run per call) keeps the async HTTP client's sessions valid between calls.
+    """
+    global _embed_loop
+    with _embed_loop_lock:
+        if _embed_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="embed-loop", daemon=True).start()
+            _embed_loop = loop
+        return _embed_loop
+
+
+async def _aembed_batches(batches: List[List[str]]) -> List[List[List[float]]]:
+    # Up to EMBED_CONCURRENCY requests in flight from one thread; gather keeps submission order
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def _embed_batch(batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            # Jittered start so concurrent batches don't hit the API as a thundering herd
+            await asyncio.sleep(random.uniform(0, 0.05))
+            return await _acall_with_backoff(embed_model.aget_text_embedding_batch, batch)
+
+    return await asyncio.gather(*(_embed_batch(batch) for batch in batches))
+
+
+def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """Generate embeddings for many texts using Voyage AI's voyage-code-3 model (EMBED_BATCH_SIZE per request)"""
+    if any(not text or not text.strip() for text in texts):
+        raise RuntimeError("Empty text provided for embedding")
+    try:
+        # Use LlamaIndex VoyageEmbedding - batched document embeddings, one HTTPS round trip per batch.
+        # Multiple batches go out concurrently through the async API (up to EMBED_CONCURRENCY in
+        # flight on one event loop) and are reassembled in submission order.
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        if len(batches) == 1:
+            embeddings = _call_with_backoff(embed_model.get_text_embedding_batch, batches[0])
+        else:
+            results = asyncio.run_coroutine_threadsafe(_aembed_batches(batches), _get_embed_loop()).result()
+            embeddings = [embedding for result in results for embedding in result]
+        if len(embeddings) != len(texts):
+            raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return _validate_embeddings(embeddings)
     except Exception as e:
         raise RuntimeError(f"Embedding failed: {e}")
 
 
-def get_accurate_line_range(chunk: str, full_text: str) -> str:
-    if not full_text or not chunk:
+def get_embedding(text: str) -> List[float]:
+    """Generate embedding using Voyage AI's voyage-code-3 model"""
+    return get_embeddings([text])[0]
+
+
+def build_line_index(full_lines: List[str]) -> Dict[str, int]:
+    """Map each stripped line of the file to its first 1-based line number (one pass per file)."""
+    line_index: Dict[str, int] = {}
+    for i, line in enumerate(full_lines):
+        line_index.setdefault(line.strip(), i + 1)
+    return line_index
+
+
+class MmapLineIndex:
+    """
+    Line-number lookups over a memory-mapped file, used instead of build_line_index for large files.
+
+    Only the byte offset of each line start is kept; the text is never decoded into a Python str.
+    """
+
+    def __init__(self, path: Path):
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._line_starts = [0]
+        pos = self._mm.find(b"\n")
+        while pos != -1:
+            self._line_starts.append(pos + 1)
+            pos = self._mm.find(b"\n", pos + 1)
+        self._cursor = 0  # chunks arrive in file order, so resume searching at the previous hit's line
+
+    def __bool__(self) -> bool:
+        return True
+
+    def get(self, line: str) -> Optional[int]:
+        """
+        1-based number of the next line whose stripped text is `line`, or None.
+
+        Like build_line_index, only whole lines match (not text inside a longer line). The search
+        starts at the previous hit's line and wraps to the top of the file, so a chunk that starts
+        before the previous one (overlap, re-chunking) is still found.
+        """
+        needle = line.encode("utf-8")
+        if not needle:
+            return None
+        lineno = self._find_line(line, needle, self._cursor, len(self._mm))
+        if lineno is None:
+            lineno = self._find_line(line, needle, 0, self._cursor + len(needle))
+            if lineno is None:
+                return None
+        self._cursor = self._line_starts[lineno - 1]
+        return lineno
+
+    def _find_line(self, line: str, needle: bytes, start: int, end: int) -> Optional[int]:
+        pos = self._mm.find(needle, start, end)
+        while pos != -1:
+            lineno = bisect.bisect_right(self._line_starts, pos)
+            line_end = self._line_starts[lineno] if lineno < len(self._line_starts) else len(self._mm)
+            # Decoded and stripped the way build_line_index strips its keys
+            if self._mm[self._line_starts[lineno - 1]:line_end].decode("utf-8", errors="ignore").strip() == line:
+                return lineno
+            pos = self._mm.find(needle, line_end, end)  # a line holds at most one match; try the next
+        return None
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def get_accurate_line_range(chunk: str, line_index: Union[Dict[str, int], MmapLineIndex]) -> str:
+    if not line_index or not chunk:
         return "L1-L1"
 
-    try:
-        chunk_clean = chunk.strip()
-        if not chunk_clean:
-            return "L1-L1"
-
-        full_lines = full_text.split('\n')
-        chunk_lines = chunk_clean.split('\n')
-
-        first_chunk_line = chunk_lines[0].strip()
-        if not first_chunk_line:
-            return "L1-L1"
-
-        for i, line in enumerate(full_lines):
-            if first_chunk_line in line.strip() or line.strip() in first_chunk_line:
-                start_line = i + 1
-                end_line = start_line + len(chunk_lines) - 1
-                return f"L{start_line}-L{end_line}"
-
-        for i, line in enumerate(full_lines):
-            if len(line.strip()) > 10 and line.strip() in chunk:
-                start_line = i + 1
-                chunk_line_count = chunk.count('\n') + 1
-                end_line = start_line + chunk_line_count - 1
-                return f"L{start_line}-L{end_line}"
+    chunk_clean = chunk.strip()
+    if not chunk_clean:
+        return "L1-L1"
 
+    # O(1) lookup of the chunk's first line instead of scanning every line of the file per chunk
+    start_line = line_index.get(chunk_clean.split('\n', 1)[0].strip())
+    if start_line is None:
         return "L1-L1"
+    end_line = start_line + chunk_clean.count('\n')
+    return f"L{start_line}-L{end_line}"
+
 
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_vector_id(repo_name: str, file_path: str, chunk_index: int) -> str:
+    """Stable id for a chunk position, so re-indexing a file overwrites its vectors in place."""
+    return hashlib.blake2b(f"{repo_name}|{file_path}|{chunk_index}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def fetch_stored_content_shas(file_paths: List[str], repo_name: str) -> Dict[str, str]:
+    """
+    content_sha256 of many files, read from each file's chunk-0 vector (its id is deterministic,
+    so one fetch by id replaces a filtered query per file).
+
+    Files missing from the result have no vectors. Files mapped to "" have vectors but no chunk 0
+    (written before deterministic ids, or by a run that failed before writing chunk 0, the only
+    vector whose hash proves the whole file landed), or the lookup failed; they are cleared and
+    re-indexed.
+    """
+    if not file_paths:
+        return {}
+    ids = {chunk_vector_id(repo_name, file_path, 0): file_path for file_path in file_paths}
+    try:
+        res = index.fetch(ids=list(ids), namespace=DEFAULT_NAMESPACE)
     except Exception as e:
-        print(f"[warn] Error calculating line range: {e}")
-        return "L1-L1"
+        # The lookup only lets us skip work; on any failure re-index the files from scratch.
+        print(f"[warn] Could not fetch stored content hashes for {len(file_paths)} files: {e}")
+        return {file_path: "" for file_path in file_paths}
+    vectors = res.get("vectors") if isinstance(res, dict) else getattr(res, "vectors", None)
+    stored = {}
+    for vector_id, vector in (vectors or {}).items():
+        if vector_id in ids:
+            md = vector.get("metadata") if isinstance(vector, dict) else getattr(vector, "metadata", None)
+            stored[ids[vector_id]] = (md or {}).get("content_sha256") or ""
+    missing = [file_path for file_path in file_paths if file_path not in stored]
+    if missing:
+        stored.update(dict.fromkeys(probe_indexed_paths(missing, repo_name), ""))
+    return stored
+
+
+def probe_indexed_paths(file_paths: List[str], repo_name: str) -> List[str]:
+    """
+    Which of `file_paths` have any vectors, via a metadata query with a $in filter over all of them.
 
+    A full page of matches may hide some paths behind a file with many chunks, so the paths not
+    seen yet are queried again until a page comes back short. If a query fails, every path not
+    seen yet is reported as indexed (the caller then re-indexes it from scratch).
+    """
+    found: List[str] = []
+    remaining = set(file_paths)
+    while remaining:
+        try:
+            res = index.query(
+                vector=[1.0] * DIMENSION,  # any non-zero vector; cosine is undefined for all zeros
+                top_k=STORED_SHA_PROBE_TOP_K,
+                filter={"repo_name": repo_name, "file_path": {"$in": sorted(remaining)}},
+                include_metadata=True,
+                include_values=False,
+                namespace=DEFAULT_NAMESPACE,
+            )
+        except Exception as e:
+            print(f"[warn] Could not look up stored vectors for {len(remaining)} files: {e}")
+            return found + sorted(remaining)
+        matches = (res.get("matches") if isinstance(res, dict) else getattr(res, "matches", None)) or []
+        seen = set()
+        for m in matches:
+            md = m.get("metadata") if isinstance(m, dict) else getattr(m, "metadata", None)
+            file_path = (md or {}).get("file_path")
+            if file_path in remaining:
+                seen.add(file_path)
+        found.extend(seen)
+        remaining -= seen
+        if len(matches) < STORED_SHA_PROBE_TOP_K or not seen:
+            break
+    return found
+
+
+def produce_chunks(filepath: str, status: str, repo_name: str, commit_sha: str, repo_root: str = ".",
+                   content_sha256: str = "", raw: Optional[bytes] = None,
+                   size: Optional[int] = None) -> List[ChunkRow]:
+    """
+    Chunk a file into rows (no embedding); the CPU-bound first stage of the sync pipeline.
 
-def process_file(filepath: str, status: str, repo_name: str, commit_sha: str):
+    `raw` is the file's bytes if the caller already read them (prefetch); the hash, chunker and
+    line index then work from memory instead of reopening the file, and no stat is needed.
+    `size` is the file size from a caller's earlier stat, likewise saving one.
+    """
+    # `filepath` is repo-relative (stored in metadata); disk access resolves it against repo_root
+    # so callers never need to chdir.
+    disk_path = Path(repo_root) / filepath
     try:
-        if not Path(filepath).exists():
+        try:
+            # At most one stat per file; the size is reused for summaries and the mmap threshold.
+            if raw is not None:
+                file_size = len(raw)
+            else:
+                file_size = size if size is not None else disk_path.stat().st_size
+        except FileNotFoundError:
             print(f"[warn] File not found: {filepath}")
             return []
 
-        chunks, should_embed, chunk_type = dispatch_chunking(Path(filepath))
-        chunk_entries = []
+        text = None
+        if raw is not None:
+            # Same universal-newline translation as the text-mode reads of chunk_file/read_text
+            text = raw.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+        chunks, should_embed, chunk_type = dispatch_chunking(disk_path, size=file_size, text=text)
+        chunk_rows: List[ChunkRow] = []
 
-        full_text = ""
+        line_index: Union[Dict[str, int], MmapLineIndex] = {}
         if chunk_type == "content":
             try:
-                full_text = Path(filepath).read_text(encoding="utf-8", errors="ignore")
+                if file_size >= MMAP_LINE_INDEX_MIN_BYTES:
+                    # Large file: look lines up in a memory map instead of copying the text into a str.
+                    line_index = MmapLineIndex(disk_path)
+                else:
+                    # Read and split once per file; only the line index is kept, not the joined text.
+                    if text is None:
+                        text = disk_path.read_text(encoding="utf-8", errors="ignore")
+                    line_index = build_line_index(text.splitlines())
             except Exception as e:
                 print(f"[warn] Could not read full text for {filepath}: {e}")
 
-        for i, chunk in enumerate(chunks):
-            if not chunk or not chunk.strip():
-                continue
+        # Encode all chunks of the file in one batched call; counts are reused for the embed gate and metadata
+        token_counts = count_tokens_batch(chunks)
+
+        meta = FileMeta(
+            repo_name=repo_name,
+            file_path=str(filepath),
+            file_type=sys.intern(detect_file_type(str(disk_path))),
+            chunk_type=chunk_type,
+            should_embed=bool(should_embed),
+            status=status,
+            commit_sha=commit_sha,
+            indexed_at=datetime.utcnow().isoformat() + "Z",
+            content_sha256=content_sha256 or (hashlib.sha256(raw).hexdigest() if raw is not None else file_sha256(disk_path)),
+        )
 
-            chunk_id = str(uuid.uuid4())
-            vector: List[float] = []
-
-            if should_embed and count_tokens(chunk) <= MAX_TOKENS:
-                vector = get_embedding(chunk)
-
-            chunk_entry = {
-                "id": chunk_id,
-                "values": vector,
-                "metadata": {
-                    "repo_name": repo_name,
-                    "file_path": str(filepath),
-                    "file_type": detect_file_type(filepath),
-                    "chunk_type": chunk_type,
-                    "chunk_index": i,
-                    "chunk_id": chunk_id,
-                    "content": chunk,
-                    "line_range": get_accurate_line_range(chunk, full_text),
-                    "embedded": bool(vector),
-                    "should_embed": bool(should_embed),
-                    "status": status,
-                    "token_count": count_tokens(chunk),
-                    "commit_sha": commit_sha,
-                    "indexed_at": datetime.utcnow().isoformat() + "Z"
-                }
-            }
-            chunk_entries.append(chunk_entry)
-
-        return chunk_entries
+        try:
+            for i, chunk in enumerate(chunks):
+                if not chunk or not chunk.strip():
+                    continue
+
+                row = ChunkRow(
+                    id=chunk_vector_id(repo_name, str(filepath), i),
+                    meta=meta,
+                    chunk_index=i,
+                    content=chunk,
+                    line_range=get_accurate_line_range(chunk, line_index),
+                    token_count=token_counts[i],
+                )
+                chunk_rows.append(row)
+        finally:
+            if isinstance(line_index, MmapLineIndex):
+                line_index.close()
+
+        return chunk_rows
 
     except Exception as e:
         print(f"[error] Failed to process {filepath}: {e}")
         raise
 
 
+def embeddable_rows(rows: List[ChunkRow]) -> List[ChunkRow]:
+    """Rows that should be embedded and fit the embedding token limit."""
+    return [row for row in rows if row.meta.should_embed and row.token_count <= MAX_TOKENS]
+
+
+def embed_rows(rows: List[ChunkRow]) -> None:
+    """
+    Embed, in place, every row that should be embedded and fits the embedding token limit.
+
+    Identical texts (copied headers, generated or vendored files) are sent to Voyage once and
+    the vector is shared by every row carrying that text.
+    """
+    to_embed = embeddable_rows(rows)
+    if not to_embed:
+        return
+    by_text: Dict[bytes, List[ChunkRow]] = {}
+    for row in to_embed:
+        by_text.setdefault(_text_key(row.content), []).append(row)
+    # Embed all unique chunks in batched requests instead of one call per chunk
+    groups = list(by_text.values())
+    vectors = get_embeddings([group[0].content for group in groups])
+    for group, vector in zip(groups, vectors):
+        for row in group:
+            row.values = vector
+            row.embedded = True
+
+
+def _delete_with_backoff(**kwargs) -> None:
+    _call_with_backoff(functools.partial(index.delete, namespace=DEFAULT_NAMESPACE, **kwargs),
+                       retries=PINECONE_MAX_RETRIES, initial=0.5, retryable=_is_transient, label="delete")
+
+
 def safe_delete_vectors(file_path: str, repo_name: str) -> None:
     try:
-        _ = index.delete(
-            filter={"repo_name": repo_name, "file_path": file_path},
-            namespace=DEFAULT_NAMESPACE
-        )
+        _delete_with_backoff(filter={"repo_name": repo_name, "file_path": file_path})
         print(f"[info] Deleted vectors for: {file_path}")
     except Exception as e:
         msg = str(e).lower()
@@ -406,13 +960,166 @@ def safe_delete_vectors(file_path: str, repo_name: str) -> None:
         raise
 
 
-def safe_upsert_batch(batch: List[dict], repo_name: str) -> int:
-    for entry in batch:
-        md = entry.get("metadata", {})
-        if md.get("chunk_type") == "content" and not entry.get("values"):
-            raise RuntimeError(f"Attempted to upsert empty embedding: {md.get('file_path')}")
-    index.upsert(vectors=batch, namespace=DEFAULT_NAMESPACE)
-    return len(batch)
+def delete_vector_ids(ids: List[str]) -> None:
+    """Delete vectors by id (at most DELETE_IDS_BATCH per call); ids that don't exist are ignored."""
+    _delete_with_backoff(ids=ids)
+
+
+def _read_manifest_entries(path: str) -> List[dict]:
+    try:
+        with open(path, "rb") as f:
+            data = _loads(f.read())
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"[warn] Ignoring unreadable manifest {path}: {e}")
+        return []
+    entries = data.get("entries") if isinstance(data, dict) else None
+    return [entry for entry in entries or [] if isinstance(entry, dict)]
+
+
+def _is_manifest_entry(entry: dict, index_name: str, repo_name: str) -> bool:
+    return (entry.get("index") == index_name and entry.get("namespace") == DEFAULT_NAMESPACE
+            and entry.get("repo_name") == repo_name)
+
+
+def load_manifest(path: str, index_name: str, repo_name: str) -> Dict[str, int]:
+    """
+    file_path -> chunk count last written to this index/namespace for repo_name, from the sidecar manifest.
+
+    Counts are kept per (index, namespace, repo_name): the same checkout may sync into several indexes,
+    and ids embed the repo name. Empty if the manifest is missing, unreadable or has no such entry.
+    """
+    for entry in _read_manifest_entries(path):
+        if _is_manifest_entry(entry, index_name, repo_name):
+            return {str(k): int(v) for k, v in (entry.get("chunk_counts") or {}).items()}
+    return {}
+
+
+def save_manifest(path: str, index_name: str, repo_name: str, chunk_counts: Dict[str, int]) -> None:
+    """
+    Replace this index/namespace/repo_name entry, keeping the others; written atomically (temp file +
+    rename) so an interrupted run can't truncate it.
+    """
+    entries = [entry for entry in _read_manifest_entries(path)
+               if not _is_manifest_entry(entry, index_name, repo_name)]
+    entries.append({"index": index_name, "namespace": DEFAULT_NAMESPACE, "repo_name": repo_name,
+                    "chunk_counts": chunk_counts})
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_bytes(_json_bytes({"entries": entries}))
+    os.replace(tmp, p)
+
+
+def fetch_existing_ids(ids: List[str]) -> Set[str]:
+    """Which of `ids` exist in the index (STORED_SHA_FETCH_BATCH ids per fetch); fetch errors propagate."""
+    existing: Set[str] = set()
+    for start in range(0, len(ids), STORED_SHA_FETCH_BATCH):
+        res = index.fetch(ids=ids[start:start + STORED_SHA_FETCH_BATCH], namespace=DEFAULT_NAMESPACE)
+        vectors = res.get("vectors") if isinstance(res, dict) else getattr(res, "vectors", None)
+        existing.update(vectors or {})
+    return existing
+
+
+def sweep_stale_chunks(chunk_counts: List[Tuple[str, int]], repo_name: str) -> None:
+    """
+    Delete vectors left over from longer previous versions of files: for each (file_path, chunk_count),
+    every chunk with chunk_index >= chunk_count. All files go into one $or filter, so one request
+    covers the whole group.
+    """
+    if not chunk_counts:
+        return
+    clauses = [{"file_path": file_path, "chunk_index": {"$gte": chunk_count}} for file_path, chunk_count in chunk_counts]
+    try:
+        _delete_with_backoff(filter={"repo_name": repo_name, "$or": clauses})
+    except Exception as e:
+        msg = str(e).lower()
+        if "namespace not found" in msg or "code\":5" in msg:
+            return
+        raise
+
+
+def iter_batches(rows: List[ChunkRow], max_count: int = BATCH_SIZE,
+                 max_bytes: int = UPSERT_MAX_BYTES) -> Iterator[Tuple[List[ChunkRow], List[dict]]]:
+    """
+    Yield (rows, vectors) batches that hold at most max_count vectors and whose serialized
+    size stays under max_bytes, whichever bound is hit first.
+
+    Each vector dict is built once here and handed on to the upsert, so measuring a batch
+    costs no extra to_vector() calls. A single row larger than max_bytes is still yielded
+    on its own and left for Pinecone to reject.
+    """
+    current: List[ChunkRow] = []
+    vectors: List[dict] = []
+    current_bytes = 0
+    for row in rows:
+        vector = row.to_vector()
+        vector_bytes = len(_json_bytes(vector))
+        if current and (len(current) >= max_count or current_bytes + vector_bytes > max_bytes):
+            yield current, vectors
+            current, vectors, current_bytes = [], [], 0
+        current.append(row)
+        vectors.append(vector)
+        current_bytes += vector_bytes
+    if current:
+        yield current, vectors
+
+
+def wait_upsert(pending, timeout: float):
+    """Wait for an async upsert: REST returns an AsyncResult (.get), gRPC a future (.result)."""
+    getter = getattr(pending, "get", None)
+    return getter(timeout=timeout) if callable(getter) else pending.result(timeout=timeout)
+
+
+def safe_upsert_batch(batch: List[ChunkRow], repo_name: str, vectors: Optional[List[dict]] = None):
+    """
+    Validate and submit one upsert request without blocking; wait for the returned async
+    result with wait_upsert(). Callers size batches with iter_batches().
+    """
+    for row in batch:
+        if row.meta.chunk_type == "content" and not row.values:
+            raise RuntimeError(f"Attempted to upsert empty embedding: {row.meta.file_path}")
+    if vectors is None:
+        vectors = [row.to_vector() for row in batch]
+    return index.upsert(vectors=vectors, namespace=DEFAULT_NAMESPACE, async_req=True)
+
+
+# Event fields (dotted paths) needed to derive the commit range, per supported event type
+_GITHUB_EVENT_FIELDS = {
+    "push": ("before", "after"),
+    "pull_request": ("pull_request.base.sha", "pull_request.merge_commit_sha"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _read_github_event_fields(event_path: str, fields: Tuple[str, ...]) -> Dict[str, Optional[str]]:
+    """
+    Extract only `fields` from the GitHub event file (parsed at most once per process).
+
+    With ijson the file is streamed and reading stops as soon as every field has been seen,
+    so large payloads (e.g. force pushes with many commits) are not parsed in full.
+    """
+    found: Dict[str, Optional[str]] = {}
+    if ijson is not None:
+        wanted = set(fields)
+        with open(event_path, 'rb') as f:
+            for prefix, event, value in ijson.parse(f):
+                if prefix in wanted and event in ("string", "null"):
+                    found[prefix] = value
+                    if len(found) == len(wanted):
+                        break
+        return found
+
+    with open(event_path, 'rb') as f:
+        event = _loads(f.read())
+    for field_path in fields:
+        node = event
+        for key in field_path.split("."):
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, str) or node is None:
+            found[field_path] = node
+    return found
 
 
 def detect_github_commit_range() -> Tuple[str, str]:
@@ -432,23 +1139,23 @@ def detect_github_commit_range() -> Tuple[str, str]:
     if not os.path.exists(event_path):
         raise RuntimeError(f"GitHub event file not found: {event_path}")
 
+    fields = _GITHUB_EVENT_FIELDS.get(event_name or "")
+    if fields is None:
+        raise RuntimeError(f"Unsupported GitHub event type: {event_name}. "
+                          "Only 'push' and 'pull_request' events are supported. "
+                          "Use --from-commit for manual runs.")
+
     try:
-        with open(event_path, 'r', encoding='utf-8') as f:
-            event = json.load(f)
+        event = _read_github_event_fields(event_path, fields)
     except Exception as e:
         raise RuntimeError(f"Failed to parse GitHub event file: {e}")
 
     if event_name == "push":
-        base = event.get("before", "")
-        head = github_sha or event.get("after", "")
-    elif event_name == "pull_request":
-        pr = event.get("pull_request", {})
-        base = pr.get("base", {}).get("sha", "")
-        head = pr.get("merge_commit_sha") or github_sha or ""
+        base = event.get("before") or ""
+        head = github_sha or event.get("after") or ""
     else:
-        raise RuntimeError(f"Unsupported GitHub event type: {event_name}. "
-                          "Only 'push' and 'pull_request' events are supported. "
-                          "Use --from-commit for manual runs.")
+        base = event.get("pull_request.base.sha") or ""
+        head = event.get("pull_request.merge_commit_sha") or github_sha or ""
 
     # Handle empty tree / first commit
     if not base or base == "0000000000000000000000000000000000000000":
@@ -472,6 +1179,9 @@ def parse_args():
                         help="Retry files listed in an errors file (default: chat/.vector_sync_errors.jsonl)")
     parser.add_argument("--errors-out", dest="errors_out", default="chat/.vector_sync_errors.jsonl",
                         help="Path to write JSONL errors")
+    parser.add_argument("--manifest", dest="manifest", default="chat/.vector_db_sync_manifest.json",
+                        help="Sidecar file of per-file chunk counts, used to delete vectors by id "
+                             "(default: chat/.vector_db_sync_manifest.json)")
     parser.add_argument("--from-commit", dest="from_commit",
                         help="Compute changes from this commit/ref to HEAD or --to-commit. "
                              "For bulk ingestion of all files, use: 4b825dc642cb6eb9a060e54bf8d69288fbee4904 (empty tree)")
@@ -486,21 +1196,58 @@ def parse_args():
     return parser.parse_args()
 
 
+def _error_line(file_path: str, operation: str, message: str, status: Optional[str] = None) -> str:
+    rec = {"file_path": file_path, "operation": operation, "message": message}
+    if status:
+        rec["status"] = status
+    return _dumps(rec) + "\n"
+
+
 def append_error(path: str, file_path: str, operation: str, message: str, status: Optional[str] = None) -> None:
     try:
-        rec = {"file_path": file_path, "operation": operation, "message": message}
-        if status:
-            rec["status"] = status
         p = Path(path)
         p.parent.mkdir(parents=True, exist_ok=True)
         with p.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(rec) + "\n")
+            f.write(_error_line(file_path, operation, message, status))
     except Exception:
         # Swallow error; rely on idempotent commit-range replay for recovery
         pass
 
 
-def _run_git(args: List[str], cwd: str) -> str:
+class ErrorLog:
+    """
+    Append-only JSONL error log kept open for a whole sync run.
+
+    append_error() opens and closes the file per record; during a sync, pipeline threads can fail
+    many files in a burst, so they share one buffered handle behind a lock instead. The file is
+    opened on the first record (no file is created when nothing fails); call close() to flush.
+    """
+
+    def __init__(self, path: str):
+        self._path = Path(path)
+        self._fh = None
+        self._lock = threading.Lock()
+
+    def write(self, file_path: str, operation: str, message: str, status: Optional[str] = None) -> None:
+        line = _error_line(file_path, operation, message, status)
+        with self._lock:
+            try:
+                if self._fh is None:
+                    self._path.parent.mkdir(parents=True, exist_ok=True)
+                    self._fh = self._path.open("a", encoding="utf-8", buffering=1 << 16)
+                self._fh.write(line)
+            except Exception:
+                # Swallow error; rely on idempotent commit-range replay for recovery
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def _git_cmd(args: List[str], cwd: str) -> List[str]:
     # Git will refuse to run on repos owned by a different OS user unless marked safe.
     # We pass safe.directory via -c so local runs (and automation users) work without mutating global git config.
     def _norm_safe_dir(p: str) -> str:
@@ -536,18 +1283,54 @@ def _run_git(args: List[str], cwd: str) -> str:
     for d in safe_dirs_dedup:
         cmd.extend(["-c", f"safe.directory={d}"])
     cmd.extend(args)
+    return cmd
+
 
-    cp = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+def _run_git(args: List[str], cwd: str) -> str:
+    cp = subprocess.run(_git_cmd(args, cwd), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     if cp.returncode != 0:
         raise RuntimeError(f"git {' '.join(args)} failed: {cp.stderr.strip()}")
     return cp.stdout
 
 
+def _iter_git_lines(args: List[str], cwd: str) -> Iterator[str]:
+    """
+    Yield non-empty, stripped stdout lines of a git command as they are produced.
+
+    Unlike _run_git, the full output is never held in memory, which matters for
+    `ls-files` / `ls-tree -r` on large repos. Raises RuntimeError once the output is
+    exhausted if git exited non-zero, so lines already yielded may be a truncated listing:
+    callers collect them and only act once the generator has finished.
+
+    stderr goes to a temp file rather than a pipe: nothing reads a pipe while stdout is being
+    drained, so enough warnings (e.g. from many submodules) would fill it and block git.
+    """
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            _git_cmd(args, cwd), cwd=cwd, stdout=subprocess.PIPE, stderr=err, text=True, bufsize=1
+        )
+        try:
+            for line in proc.stdout:
+                line = line.strip()
+                if line:
+                    yield line
+            returncode = proc.wait()
+        finally:
+            if proc.poll() is None:
+                # Consumer stopped early; don't leave git running
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+        if returncode != 0:
+            err.seek(0)
+            stderr = err.read().decode("utf-8", errors="replace")
+            raise RuntimeError(f"git {' '.join(args)} failed: {stderr.strip()}")
+
+
 def _parse_submodule_short(diff_text: str) -> List[Tuple[str, str, str]]:
     results: List[Tuple[str, str, str]] = []
     for line in diff_text.splitlines():
-        # `git diff --submodule=short` may use either `..` or `...` between SHAs.
-        m = re.match(r"^Submodule\s+([^\s]+)\s+([0-9a-f]{7,})\.{2,3}([0-9a-f]{7,}).*$", line.strip())
+        m = _SUBMODULE_SHORT_RE.match(line.strip())
         if m:
             results.append((m.group(1), m.group(2), m.group(3)))
     return results
@@ -558,29 +1341,24 @@ def _get_submodule_paths(repo_root: str) -> List[str]:
     if not gm.exists():
         return []
 
+    # Dedup while preserving order.
+    seen = set()
+    paths: List[str] = []
     try:
-        out = _run_git(
+        for line in _iter_git_lines(
             ["config", "--file", ".gitmodules", "--get-regexp", r"submodule\..*\.path"],
             repo_root,
-        )
+        ):
+            parts = line.split(None, 1)
+            if len(parts) == 2 and parts[1].strip():
+                # Normalize to forward slashes for Pinecone metadata consistency.
+                p = parts[1].strip().replace("\\", "/")
+                if p not in seen:
+                    seen.add(p)
+                    paths.append(p)
     except Exception:
         return []
-
-    paths: List[str] = []
-    for line in out.splitlines():
-        parts = line.strip().split(None, 1)
-        if len(parts) == 2 and parts[1].strip():
-            # Normalize to forward slashes for Pinecone metadata consistency.
-            paths.append(parts[1].strip().replace("\\", "/"))
-
-    # Dedup while preserving order.
-    seen = set()
-    deduped: List[str] = []
-    for p in paths:
-        if p not in seen:
-            seen.add(p)
-            deduped.append(p)
-    return deduped
+    return paths
 
 
 def compute_reindex_all_files(repo_root: str, errors_out: str) -> List[Tuple[str, str]]:
@@ -592,16 +1370,36 @@ def compute_reindex_all_files(repo_root: str, errors_out: str) -> List[Tuple[str
     """
     submodules = set(_get_submodule_paths(repo_root))
 
+    # Stream git output and dedup as we go (preserving order) instead of buffering whole listings.
+    seen = set()
+    files: List[Tuple[str, str]] = []
+
+    def _add(fp: str) -> None:
+        fp = fp.replace("\\", "/")
+        if fp not in seen:
+            seen.add(fp)
+            files.append(("A", fp))
+
+    # Fast path: one git process lists the superproject and every checked-out submodule (Git >= 2.11).
+    try:
+        for fp in _iter_git_lines(["ls-files", "--recurse-submodules"], repo_root):
+            if fp in submodules:
+                continue
+            _add(fp)
+        for sub_path in sorted(submodules):
+            if not (Path(repo_root) / sub_path).is_dir():
+                append_error(errors_out, sub_path, "ls-files-submodule", "Submodule path not found on disk")
+        return files
+    except RuntimeError as e:
+        print(f"[warn] git ls-files --recurse-submodules failed; listing submodules one by one: {e}")
+        seen.clear()
+        files.clear()
+
     # Superproject tracked files (exclude submodule gitlink entries).
-    super_out = _run_git(["ls-files"], repo_root)
-    all_files: List[str] = []
-    for fp in super_out.splitlines():
-        fp = fp.strip()
-        if not fp:
-            continue
+    for fp in _iter_git_lines(["ls-files"], repo_root):
         if fp in submodules:
             continue
-        all_files.append(fp.replace("\\", "/"))
+        _add(fp)
 
     # Submodule tracked files (prefixed by submodule path).
     for sub_path in sorted(submodules):
@@ -610,25 +1408,15 @@ def compute_reindex_all_files(repo_root: str, errors_out: str) -> List[Tuple[str
             append_error(errors_out, sub_path, "ls-files-submodule", "Submodule path not found on disk")
             continue
         try:
-            out = _run_git(["-C", str(sub_abs), "ls-files"], repo_root)
+            # Collected first: a failing listing must not leave part of the submodule queued
+            sub_files = list(_iter_git_lines(["-C", str(sub_abs), "ls-files"], repo_root))
         except Exception as e:
             append_error(errors_out, sub_path, "ls-files-submodule", str(e))
             continue
+        for fp in sub_files:
+            _add(f"{sub_path}/{fp}")
 
-        for fp in out.splitlines():
-            fp = fp.strip()
-            if not fp:
-                continue
-            all_files.append(f"{sub_path}/{fp}".replace("\\", "/"))
-
-    # Dedup while preserving order.
-    seen = set()
-    deduped: List[Tuple[str, str]] = []
-    for fp in all_files:
-        if fp not in seen:
-            seen.add(fp)
-            deduped.append(("A", fp))
-    return deduped
+    return files
 
 
 def compute_changes_from_git(repo_root: str, from_rev: str, to_rev: str) -> List[Tuple[str, str]]:
@@ -652,26 +1440,25 @@ def compute_changes_from_git(repo_root: str, from_rev: str, to_rev: str) -> List
     for sub_path, oldsha, newsha in _parse_submodule_short(sub_out):
         sub_abs = str(Path(repo_root) / sub_path)
         sub_gitdir = str(Path(repo_root) / ".git" / "modules" / sub_path)
-        added = (oldsha == "0000000" or re.fullmatch(r"0+", oldsha) is not None)
-        deleted = (newsha == "0000000" or re.fullmatch(r"0+", newsha) is not None)
+        added = set(oldsha) == {"0"}
+        deleted = set(newsha) == {"0"}
         try:
             if added:
                 # List all files at newsha as added
                 if Path(sub_abs).is_dir():
-                    out = _run_git(["-C", sub_abs, "ls-tree", "-r", "--name-only", newsha], repo_root)
+                    lines = _iter_git_lines(["-C", sub_abs, "ls-tree", "-r", "--name-only", newsha], repo_root)
                 else:
-                    out = _run_git(["--git-dir", sub_gitdir, "ls-tree", "-r", "--name-only", newsha], repo_root)
-                for f in out.splitlines():
-                    if f.strip():
-                        changes.append(("A", f"{sub_path}/{f}"))
+                    lines = _iter_git_lines(["--git-dir", sub_gitdir, "ls-tree", "-r", "--name-only", newsha], repo_root)
+                # Drained before anything is queued, so a failed listing adds nothing
+                files = list(lines)
+                changes.extend(("A", f"{sub_path}/{f}") for f in files)
             elif deleted:
                 if Path(sub_gitdir).is_dir():
-                    out = _run_git(["--git-dir", sub_gitdir, "ls-tree", "-r", "--name-only", oldsha], repo_root)
+                    lines = _iter_git_lines(["--git-dir", sub_gitdir, "ls-tree", "-r", "--name-only", oldsha], repo_root)
                 else:
-                    out = _run_git(["-C", sub_abs, "ls-tree", "-r", "--name-only", oldsha], repo_root)
-                for f in out.splitlines():
-                    if f.strip():
-                        changes.append(("D", f"{sub_path}/{f}"))
+                    lines = _iter_git_lines(["-C", sub_abs, "ls-tree", "-r", "--name-only", oldsha], repo_root)
+                files = list(lines)
+                changes.extend(("D", f"{sub_path}/{f}") for f in files)
             else:
                 # Regular diff inside submodule
                 if Path(sub_abs).is_dir():
@@ -740,9 +1527,9 @@ def main_entry():
     elif args.retry_errors:
         src = Path(args.retry_errors)
         if src.exists():
-            for line in src.read_text(encoding="utf-8").splitlines():
+            for line in src.read_bytes().splitlines():
                 try:
-                    obj = json.loads(line)
+                    obj = _loads(line)
                     fp = obj.get("file_path")
                     st = (obj.get("status") or "M").upper()
                     if st not in {"A", "M", "D"}:
@@ -790,35 +1577,51 @@ def main_entry():
         else:
             raise RuntimeError("Usage: provide one of: --files, --retry-errors, --from-commit, --reindex-all, or changed_files path")
 
-    run_sync(files_to_process, errors_out, repo_root=args.repo_root, wipe_first=args.reindex_all)
+    res = run_sync(files_to_process, errors_out, repo_root=args.repo_root, wipe_first=args.reindex_all,
+                   manifest_path=args.manifest)
+    Path(res["upserted_ids_path"]).unlink(missing_ok=True)
 
 
-def run_sync(files_to_process: List[Tuple[str, str]], errors_out: str, repo_root: str, wipe_first: bool = False):
-    # Environment context - repo_name used for metadata tagging
-    github_repo = (os.getenv("GITHUB_REPOSITORY") or "").strip()
-    repo_name = github_repo.split("/")[-1] if github_repo else ""
-    if not repo_name:
-        # Local runs may not have GitHub env; fall back to the repo root directory name.
-        repo_name = Path(repo_root).resolve().name or "unknown"
-    commit_sha = os.getenv("GITHUB_SHA", "unknown")
+@functools.lru_cache(maxsize=None)
+def _get_pinecone_client(api_key: str):
+    """
+    Serverless Pinecone client, created once per API key and reused by later run_sync calls.
 
-    # Initialize external clients and tokenizer lazily
-    global index, tokenizer, pc
-    index_name = os.getenv("PINECONE_INDEX", INDEX_NAME)
-    api_key = os.environ.get("PINECONE_API_KEY", "")
+    Uses the gRPC client when pinecone[grpc] is installed, unless PINECONE_TRANSPORT=rest.
+    """
+    if PineconeGRPC is not None and PINECONE_TRANSPORT != "rest":
+        return PineconeGRPC(api_key=api_key)
+    from pinecone import Pinecone  # type: ignore
+    return Pinecone(api_key=api_key)
+
+
+def _index_exists(describe_index, index_name: str) -> bool:
+    """True if describe_index(index_name) finds the index, False on a 404; other errors propagate."""
+    try:
+        describe_index(index_name)
+        return True
+    except Exception as e:
+        status = getattr(e, "status", None) or getattr(e, "http_status", None)
+        if status == 404 or type(e).__name__ == "NotFoundException":
+            return False
+        raise
+
+
+@functools.lru_cache(maxsize=None)
+def _get_index(index_name: str, api_key: str, pool_threads: int):
+    """
+    Index handle, creating the index if it does not exist yet.
 
+    Cached per (index, key, pool size): a process that syncs repeatedly (long CI job, server) checks
+    the index and opens the connection pool once instead of on every run_sync call.
+    """
+    global pc
     if USE_SERVERLESS:
-        from pinecone import Pinecone, ServerlessSpec  # type: ignore
-        pc = Pinecone(api_key=api_key)
-        # Ensure index exists (serverless)
+        from pinecone import ServerlessSpec  # type: ignore
+        pc = _get_pinecone_client(api_key)
+        # Ensure index exists (serverless): one describe_index lookup rather than listing every index
         try:
-            idxs = pc.list_indexes()
-            names = []
-            if hasattr(idxs, "indexes"):
-                names = [ix.name for ix in idxs.indexes]
-            else:
-                names = [getattr(ix, "name", None) or ix.get("name") for ix in idxs]  # type: ignore
-            if index_name not in set([n for n in names if n]):
+            if not _index_exists(pc.describe_index, index_name):
                 cloud = os.getenv("PINECONE_CLOUD", "aws")
                 region = os.getenv("PINECONE_REGION", "us-east-1")
                 print(
@@ -833,8 +1636,12 @@ def run_sync(files_to_process: List[Tuple[str, str]], errors_out: str, repo_root
                 except Exception as e:
                     print(f"[warn] create_index failed or already exists: {e}")
         except Exception as e:
-            print(f"[warn] Could not list/create serverless index: {e}")
-        index = pc.Index(index_name)
+            print(f"[warn] Could not describe/create serverless index: {e}")
+        if PineconeGRPC is not None and isinstance(pc, PineconeGRPC):
+            # gRPC multiplexes async upserts over one HTTP/2 channel; no REST thread pool to size
+            print(f"[info] Using Pinecone gRPC transport (set PINECONE_TRANSPORT=rest to disable)")
+            return pc.Index(index_name, grpc_config=GRPCClientConfig(secure=True))
+        return pc.Index(index_name, pool_threads=pool_threads)
     else:
         if pinecone_client is None:
             raise RuntimeError(
@@ -845,14 +1652,7 @@ def run_sync(files_to_process: List[Tuple[str, str]], errors_out: str, repo_root
         )
         # Ensure index exists (classic client)
         try:
-            existing = []
-            try:
-                existing = pinecone_client.list_indexes()
-            except Exception:
-                existing = []
-            if isinstance(existing, dict) and "indexes" in existing:
-                existing = [ix.get("name") for ix in existing.get("indexes", [])]
-            if index_name not in set(existing or []):
+            if not _index_exists(pinecone_client.describe_index, index_name):
                 print(f"[info] Creating Pinecone classic index '{index_name}' (dim={DIMENSION}, metric={METRIC})")
                 try:
                     pinecone_client.create_index(index_name, dimension=DIMENSION, metric=METRIC)
@@ -860,22 +1660,706 @@ def run_sync(files_to_process: List[Tuple[str, str]], errors_out: str, repo_root
                     print(f"[warn] create_index failed: {e}")
         except Exception as e:
             print(f"[warn] Could not verify/create classic index '{index_name}': {e}")
-        index = pinecone_client.Index(index_name)
+        return pinecone_client.Index(index_name, pool_threads=pool_threads)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_embed_model(voyage_key: str) -> VoyageEmbedding:
+    return VoyageEmbedding(
+        model_name=EMBEDDING_MODEL,
+        voyage_api_key=voyage_key,
+        embed_batch_size=EMBED_BATCH_SIZE
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_tokenizer():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_chunker() -> LlamaChunker:
+    return LlamaChunker()
+
+
+def iter_upserted_ids(path: str) -> Iterator[str]:
+    """Stream the chunk ids from the file named by run_sync()'s `upserted_ids_path`."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
+
+@dataclass(slots=True)
+class FileState:
+    """Upsert-stage bookkeeping for one file whose rows are being written (see SyncPipeline)."""
+    status: str
+    stored_sha: Optional[str]  # None: no vectors yet; "": vectors without a trustworthy hash
+    rows_remaining: int  # rows other than chunk 0 not yet acknowledged
+    chunk_count: int
+    # Chunk 0. Its content_sha256 is what later runs compare to skip the file, so it is held back and
+    # written last, once every other row landed and any tombstone sweep succeeded. A partly written file
+    # never gets the new hash on chunk 0 and is re-indexed next run.
+    head: Optional[ChunkRow]
+    failed: bool = False
+
+
+class SyncPipeline:
+    """
+    The chunk -> embed -> upsert pipeline behind run_sync().
+
+    SYNC_WORKERS threads chunk files (CPU-bound; tree-sitter and tiktoken release the GIL) while an embed
+    thread calls Voyage and an upsert thread writes to Pinecone (network-bound). Deletes run on their own
+    pool. Bounded queues let the stages overlap and make a slow stage apply backpressure upstream. Items are
+    (status, filepath, stored_sha, pre_delete, rows); None ends a stage.
+
+    Voyage and Pinecone are reached only through the module helpers (embed_rows, safe_upsert_batch,
+    delete_vector_ids, ...), so the pipeline can be driven against a fake index. run() processes `work`
+    once and leaves its results in file_stats, failures, manifest_updates and the file at ids_path.
+    If the embed or upsert thread crashes, its files are failed, the stage keeps draining its queue so
+    the stages before it can finish, and the error is listed in stage_errors.
+    """
+
+    def __init__(self, work: List[Tuple[str, str]], repo_name: str, commit_sha: str, repo_root: str,
+                 errors_out: str, manifest: Optional[Dict[str, int]] = None, wipe_first: bool = False):
+        self.work = work
+        self.repo_name = repo_name
+        self.commit_sha = commit_sha
+        self.repo_root = repo_root
+        self.wipe_first = wipe_first
+        # Chunk counts from earlier runs (read-only during the run); changes are collected in manifest_updates
+        # (None = forget the file) for the caller to save. Files not in the manifest use filter deletes.
+        self.manifest: Dict[str, int] = manifest if manifest is not None else {}
+        self.manifest_updates: Dict[str, Optional[int]] = {}
+        self.file_stats = {"processed": 0, "errors": 0, "skipped": 0, "unchanged": 0}
+        self.failures: List[dict] = []
+        self.stage_errors: List[str] = []
+        self.deleted_files = 0
+        self.total_upserted = 0
+        self.done_files = 0
+        # Upserted ids are spilled to a temp file (one per line) instead of held in memory, so a
+        # --reindex-all of any size runs in flat memory. Created by run(); only the upsert thread writes it.
+        self.ids_path: Optional[str] = None
+        self._ids_out = None
+        self._stats_lock = threading.Lock()  # stats are updated from every pipeline stage
+        self._error_log = ErrorLog(errors_out)  # flushed and closed once the pipeline has drained
+        # One chunk-level progress bar for the whole run (drawn on a TTY only; CI logs get the periodic
+        # progress line instead). Its total grows as files are chunked; it advances as chunks are settled.
+        self._pbar = tqdm(total=0, unit="chunk", desc="Syncing", smoothing=0.1, mininterval=1.0, disable=None)
+        self._pbar_lock = threading.Lock()
+        # (filepath, status, kind, first chunk index, end chunk index) to delete by id once upserts are done;
+        # kind is "delete" (D file) or "sweep" (tombstones of a shrunk file)
+        self._pending_id_deletes: List[Tuple[str, str, str, int, int]] = []
+        self._embed_q: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._upsert_q: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._delete_pool = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="sync-delete")
+        # Prefetch: file bytes are read PREFETCH_FILES ahead of the chunk workers on a separate pool, so disk
+        # latency hides behind chunking and embedding. _reads: position in `work` -> Future[Optional[bytes]]
+        # (None for files chunked from disk, see _read_for_chunking).
+        self._read_pool = ThreadPoolExecutor(max_workers=PREFETCH_FILES, thread_name_prefix="sync-read")
+        self._reads = {}
+        self._reads_lock = threading.Lock()
+        # Stored content hashes are fetched for STORED_SHA_FETCH_BATCH files of `work` at a time, on the
+        # network pool; the next group is requested as soon as a group is first needed.
+        self._sha_groups = {}
+        self._sha_groups_lock = threading.Lock()
+        # Upsert-thread state. Rows from many files are packed into shared BATCH_SIZE upserts; a file is
+        # finished (tombstone sweep, stats) once all of its rows are acknowledged.
+        self._open_files: Dict[str, FileState] = {}
+        self._buffer: List[ChunkRow] = []
+        # Submitted (rows, vectors, async_result), oldest first. Up to PINECONE_POOL_THREADS requests stay
+        # outstanding across files instead of waiting on each flush before sending the next.
+        self._in_flight = collections.deque()
+        # (filepath, status, chunk_count) awaiting the tombstone sweep, which runs batched once all upserts are in
+        self._pending_sweeps: List[Tuple[str, str, int]] = []
+        # chunk-0 ids of partly written files, deleted at the end of the run (see _abandon)
+        self._stale_heads: List[str] = []
+
+    def run(self) -> None:
+        """Process every file in `work`; returns once all stages have drained."""
+        self._ids_out = tempfile.NamedTemporaryFile("w", encoding="utf-8", prefix="vector_sync_ids_", suffix=".txt",
+                                                    delete=False, buffering=1 << 20)
+        self.ids_path = self._ids_out.name
+        # Each chunk worker builds its tree-sitter splitters for the languages in this change set as it starts,
+        # and the shared parsers are warmed here, so the first files don't pay parser setup mid-pipeline.
+        extensions = {Path(filepath).suffix.lower() for status, filepath in self.work if status != "D"}
+        chunker.warm_up(extensions)
+        chunk_pool = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="sync-chunk",
+                                        initializer=chunker.warm_up, initargs=(extensions,))
+        stop_progress = threading.Event()
+        embed_thread = threading.Thread(target=self._embed_stage, name="sync-embed", daemon=True)
+        upsert_thread = threading.Thread(target=self._upsert_stage, name="sync-upsert", daemon=True)
+        progress_thread = threading.Thread(target=self._log_progress, args=(stop_progress, time.monotonic()),
+                                           name="sync-progress", daemon=True)
+        embed_thread.start()
+        upsert_thread.start()
+        progress_thread.start()
+
+        # Process files (chunking stage)
+        try:
+            for position in range(PREFETCH_FILES):
+                self._prefetch(position)
+            futures = [chunk_pool.submit(self._prepare_file, position, status, filepath)
+                       for position, (status, filepath) in enumerate(self.work)]
+            for future in futures:
+                future.result()
+        finally:
+            # Drain the pipeline before reporting
+            chunk_pool.shutdown(wait=True)
+            self._read_pool.shutdown(wait=True)
+            self._embed_q.put(None)
+            embed_thread.join()
+            upsert_thread.join()
+            self._delete_pool.shutdown(wait=True)
+            stop_progress.set()
+            self._pbar.close()
+            self._error_log.close()
+            self._ids_out.close()
+
+    def _log_progress(self, stop: threading.Event, started: float) -> None:
+        # ETA log every PROGRESS_LOG_SECONDS: processed/total @ files/min
+        total_files = len(self.work)
+        while not stop.wait(PROGRESS_LOG_SECONDS):
+            with self._stats_lock:
+                done = self.done_files
+            minutes = (time.monotonic() - started) / 60
+            rate = done / minutes if minutes > 0 else 0.0
+            eta = f"{(total_files - done) / rate:.1f} min" if rate > 0 else "unknown"
+            print(f"[info] Progress: {done}/{total_files} files, ETA {eta} @ {rate:.1f} files/min")
+
+    def _advance(self, chunks: int) -> None:
+        with self._pbar_lock:
+            self._pbar.update(chunks)
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.file_stats[key] += 1
+
+    def _file_done(self) -> None:
+        with self._stats_lock:
+            self.done_files += 1
+
+    def _record_failure(self, filepath: str, status: str, operation: str, message: str) -> None:
+        with self._stats_lock:
+            self.file_stats["errors"] += 1
+            self.failures.append({"file_path": filepath, "operation": operation, "message": message, "status": status})
+        self._error_log.write(filepath, operation, message, status=status)
+
+    def _stage_failed(self, stage: str, error: Exception) -> str:
+        message = f"{stage} stage failed: {error!r}"
+        print(f"[error] {message}")
+        traceback.print_exc()
+        with self._stats_lock:
+            self.stage_errors.append(message)
+        return message
+
+    def _fail_item(self, item, operation: str, message: str) -> None:
+        # A queued (status, filepath, stored_sha, pre_delete, rows) item that will never be written
+        status, filepath, _, _, rows = item
+        self._record_failure(filepath, status, operation, message)
+        self._advance(len(rows))
+        self._file_done()
+
+    def _delete_file(self, status: str, filepath: str) -> None:
+        try:
+            safe_delete_vectors(filepath, self.repo_name)
+            with self._stats_lock:
+                self.deleted_files += 1
+                self.manifest_updates[filepath] = None
+        except Exception as e:
+            self._record_failure(filepath, status, "process", str(e))
+        finally:
+            self._file_done()
+
+    def _legacy_delete(self, filepath: str) -> None:
+        safe_delete_vectors(filepath, self.repo_name)
+        with self._stats_lock:
+            self.deleted_files += 1
+
+    def _delete_ids(self) -> None:
+        # Ids are deterministic, so recorded chunk counts name every vector to drop: send them in
+        # DELETE_IDS_BATCH requests. A file fails if any request carrying its ids fails.
+        # Tombstone sweeps are handed back to the upsert stage through _swept(filepath, error or None).
+        pending = self._pending_id_deletes
+        if not pending:
+            return
+        # A count is stale if a chunk past it exists (written by a run that didn't update this manifest);
+        # deleting ids up to the count would leave the rest behind, so such files use the filter
+        # delete/sweep instead. A file that grew has overwritten the ids past its old count, so the
+        # probe goes just past whichever count is higher.
+        probes = {chunk_vector_id(self.repo_name, filepath, max(start, stop)): filepath
+                  for filepath, _, _, start, stop in pending}
+        try:
+            stale = {probes[vector_id] for vector_id in fetch_existing_ids(list(probes)) if vector_id in probes}
+        except Exception as e:
+            print(f"[warn] Could not check manifest counts; using filter deletes: {e}")
+            stale = set(probes.values())
+        if stale:
+            print(f"[warn] {len(stale)} manifest entries are stale; using filter deletes for them")
+        errors: Dict[str, str] = {}
+        ids: List[str] = []
+        owners = set()
+
+        def _send() -> None:
+            try:
+                delete_vector_ids(list(ids))  # ids is reused for the next request
+            except Exception as e:
+                for owner in owners:
+                    errors.setdefault(owner, str(e))
+            ids.clear()
+            owners.clear()
+
+        for filepath, _, kind, start, stop in pending:
+            if filepath in stale:
+                try:
+                    if kind == "delete":
+                        safe_delete_vectors(filepath, self.repo_name)
+                    else:
+                        sweep_stale_chunks([(filepath, start)], self.repo_name)
+                except Exception as e:
+                    errors[filepath] = str(e)
+                continue
+            for i in range(start, stop):
+                ids.append(chunk_vector_id(self.repo_name, filepath, i))
+                owners.add(filepath)
+                if len(ids) >= DELETE_IDS_BATCH:
+                    _send()
+        if ids:
+            _send()
+
+        for filepath, status, kind, _, _ in pending:
+            if kind == "sweep":
+                self._swept(filepath, errors.get(filepath))
+            elif filepath in errors:
+                self._record_failure(filepath, status, "process", errors[filepath])
+                self.manifest_updates[filepath] = None
+            else:
+                with self._stats_lock:
+                    self.deleted_files += 1
+                self.manifest_updates[filepath] = None
+        by_id = sum(1 for filepath, _, _, start, stop in pending
+                    if start < stop and filepath not in stale and filepath not in errors)
+        print(f"[info] Deleted vectors by id for {by_id} files")
+        pending.clear()
+
+    def _prefetch(self, position: int) -> None:
+        if position >= len(self.work):
+            return
+        status, filepath = self.work[position]
+        if status == "D":
+            return  # deletions never read the file
+        if _summary_by_name(Path(filepath)):
+            return  # summaries never read the content
+        with self._reads_lock:
+            if position not in self._reads:
+                self._reads[position] = self._read_pool.submit(_read_for_chunking, Path(self.repo_root) / filepath)
+
+    def _take_read(self, position: int):
+        self._prefetch(position + PREFETCH_FILES)
+        with self._reads_lock:
+            return self._reads.pop(position, None)
+
+    def _sha_group(self, group: int):
+        if group * STORED_SHA_FETCH_BATCH >= len(self.work):
+            return None
+        with self._sha_groups_lock:
+            if group not in self._sha_groups:
+                paths = [filepath for status, filepath
+                         in self.work[group * STORED_SHA_FETCH_BATCH:(group + 1) * STORED_SHA_FETCH_BATCH]
+                         if status in ("A", "M")]
+                self._sha_groups[group] = self._delete_pool.submit(fetch_stored_content_shas, paths, self.repo_name)
+            return self._sha_groups[group]
+
+    def _stored_content_sha(self, position: int, filepath: str) -> Optional[str]:
+        # None: no vectors yet; "": vectors without a trustworthy hash (see fetch_stored_content_shas)
+        group = position // STORED_SHA_FETCH_BATCH
+        self._sha_group(group + 1)
+        return self._sha_group(group).result().get(filepath)
+
+    def _prepare_file(self, position: int, status: str, filepath: str) -> None:
+        # Claim this file's read (a failed read surfaces below only if the file is actually chunked)
+        # and keep the prefetch window moving.
+        raw_future = self._take_read(position)
+        try:
+            path = Path(self.repo_root) / filepath
+            # One stat answers both "is it a directory?" and "does it exist?" (exists() + is_dir() took two)
+            try:
+                st = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                st = None
+            if st is not None and stat.S_ISDIR(st.st_mode):
+                # Submodule entries can appear as paths in some diff modes; skip directories to avoid false failures.
+                self._count("skipped")
+                self._error_log.write(filepath, "skip-dir", "Path is a directory; skipping", status=status)
+                self._file_done()
+                return
+
+            if status == "D":
+                old_count = self.manifest.get(filepath)
+                if old_count is not None:
+                    # Deleted by id (batched across files) once the pipeline has drained
+                    with self._stats_lock:
+                        self._pending_id_deletes.append((filepath, status, "delete", 0, old_count))
+                    self._file_done()
+                    return
+                self._delete_pool.submit(self._delete_file, status, filepath)
+                return
+
+            if st is None:
+                self._count("skipped")
+                raise FileNotFoundError(f"File marked as {status} but not found: {filepath}")
+
+            raw = raw_future.result() if raw_future is not None else _read_for_chunking(path)
+            # Files chunked from disk (summaries, large files) are hashed by streaming
+            content_sha = hashlib.sha256(raw).hexdigest() if raw is not None else file_sha256(path)
+            stored_sha = None
+            pre_delete = None
+            if status in ("A", "M") and not self.wipe_first:
+                stored_sha = self._stored_content_sha(position, filepath)
+                # Byte-identical to what is already indexed: nothing to re-chunk or re-embed.
+                if stored_sha == content_sha:
+                    self._count("unchanged")
+                    self._file_done()
+                    return
+
+                if stored_sha == "":
+                    # Vectors from before deterministic ids can't be overwritten in place; clear them first.
+                    # The upsert stage waits for this before writing the file's new vectors.
+                    pre_delete = self._delete_pool.submit(self._legacy_delete, filepath)
+
+            rows = produce_chunks(filepath, status, self.repo_name, self.commit_sha, repo_root=self.repo_root,
+                                  content_sha256=content_sha, raw=raw, size=st.st_size)
+            with self._pbar_lock:
+                self._pbar.total += len(rows)
+            self._embed_q.put((status, filepath, stored_sha, pre_delete, rows))
+        except Exception as e:
+            self._record_failure(filepath, status, "process", str(e))
+            self._file_done()
+
+    def _embed_stage(self) -> None:
+        # Chunks from several files are embedded together, so Voyage requests go out full
+        # (EMBED_FLUSH_ROWS = EMBED_BATCH_SIZE per request x EMBED_CONCURRENCY in flight) instead of one
+        # small request per file. A partial group is flushed once no new file arrives for EMBED_FLUSH_SECONDS.
+        # pending_items holds the files taken off embed_q and not yet forwarded or failed.
+        pending_items = []
+        pending_rows: List[ChunkRow] = []
+
+        def _flush() -> None:
+            try:
+                embed_rows(pending_rows)
+                retry = False
+            except Exception:
+                # Retry file by file so one bad file doesn't fail the others in its group
+                retry = True
+            pending_rows.clear()
+            while pending_items:
+                item = pending_items[0]
+                if retry:
+                    try:
+                        embed_rows(item[4])
+                    except Exception as e:
+                        print(f"[error] Failed to process {item[1]}: {e}")
+                        self._fail_item(pending_items.pop(0), "process", str(e))
+                        continue
+                self._upsert_q.put(item)
+                pending_items.pop(0)
+
+        try:
+            while True:
+                try:
+                    item = self._embed_q.get(timeout=EMBED_FLUSH_SECONDS if pending_items else None)
+                except queue.Empty:
+                    _flush()
+                    continue
+                if item is None:
+                    if pending_items:
+                        _flush()
+                    break
+                pending_items.append(item)
+                pending_rows.extend(embeddable_rows(item[4]))
+                if len(pending_rows) >= EMBED_FLUSH_ROWS:
+                    _flush()
+        except Exception as e:
+            message = self._stage_failed("embed", e)
+            for item in pending_items:
+                self._fail_item(item, "process", message)
+            # Keep taking files off the queue so chunk workers blocked on put() can finish
+            while True:
+                item = self._embed_q.get()
+                if item is None:
+                    break
+                self._fail_item(item, "process", message)
+        self._upsert_q.put(None)
+
+    def _upsert_stage(self) -> None:
+        done = False
+        try:
+            while True:
+                item = self._upsert_q.get()
+                if item is None:
+                    done = True
+                    self._drain_all()
+                    self._sweep()
+                    self._drain_all()
+                    self._drop_stale_heads()
+                    return
+                status, filepath, stored_sha, pre_delete, rows = item
+                try:
+                    if pre_delete is not None:
+                        pre_delete.result()
+                except Exception as e:
+                    self._fail_item(item, "process", str(e))
+                    continue
+                self._open(status, filepath, stored_sha, rows)
+
+                if len(self._buffer) >= BATCH_SIZE:
+                    self._flush(False)
+                # Nothing else waiting: send the partial batch rather than holding rows back,
+                # and settle outstanding requests so finished files are swept and counted promptly.
+                if self._upsert_q.empty():
+                    self._drain_all()
+        except Exception as e:
+            message = self._stage_failed("upsert", e)
+            self._fail_open_files(message)
+            # Keep taking files off the queue so the embed stage can finish
+            while not done:
+                item = self._upsert_q.get()
+                if item is None:
+                    break
+                self._fail_item(item, "upsert", message)
+
+    def _fail_open_files(self, message: str) -> None:
+        # After an upsert-stage crash: nothing still pending will be written or deleted
+        self._buffer = []
+        self._in_flight.clear()
+        for filepath in list(self._open_files):
+            self._record_failure(filepath, self._open_files[filepath].status, "upsert", message)
+            self._abandon(filepath)
+        for filepath, status, kind, _, _ in self._pending_id_deletes:
+            if kind == "delete":
+                self._record_failure(filepath, status, "process", message)
+                self.manifest_updates[filepath] = None
+        self._pending_id_deletes.clear()
+        self._drop_stale_heads()
+
+    def _open(self, status: str, filepath: str, stored_sha: Optional[str], rows: List[ChunkRow]) -> None:
+        # Buffer every row except chunk 0, which _commit sends once the rest has landed
+        head = next((row for row in rows if row.chunk_index == 0), None)
+        rest = [row for row in rows if row is not head]
+        self._open_files[filepath] = FileState(status=status, stored_sha=stored_sha, rows_remaining=len(rest),
+                                               chunk_count=max((row.chunk_index for row in rows), default=-1) + 1,
+                                               head=head)
+        if rest:
+            self._buffer.extend(rest)
+        else:
+            self._finish(filepath)
+
+    def _close(self, filepath: str, chunk_count: Optional[int]) -> None:
+        # chunk_count is None when the file did not fully land, so the manifest forgets it
+        self._open_files.pop(filepath)
+        self._count("processed")
+        self.manifest_updates[filepath] = chunk_count
+        self._file_done()
+
+    def _commit(self, filepath: str) -> None:
+        # Everything else is in place: queue chunk 0, which completes the file once it lands
+        state = self._open_files[filepath]
+        head, state.head = state.head, None
+        if head is None:
+            self._close(filepath, state.chunk_count)
+        else:
+            self._buffer.append(head)
+
+    def _abandon(self, filepath: str) -> None:
+        # Chunks 1..N may already hold the new version while chunk 0 still carries the hash of an
+        # earlier one; delete that chunk 0 too, or the file would be skipped if its content reverted.
+        state = self._open_files[filepath]
+        if state.head is not None:
+            self._advance(1)  # never sent
+        if state.stored_sha:
+            self._stale_heads.append(chunk_vector_id(self.repo_name, filepath, 0))
+        self._close(filepath, None)
+
+    def _finish(self, filepath: str) -> None:
+        # Every row except chunk 0 has settled
+        state = self._open_files[filepath]
+        # Tombstone sweep: the new version overwrote chunk ids 0..N-1; drop any beyond that.
+        # Only when the file still had vectors (a legacy pre-delete already cleared the rest).
+        old_count = self.manifest.get(filepath)
+        if state.failed:
+            self._abandon(filepath)
+        elif state.stored_sha and old_count is None:
+            self._pending_sweeps.append((filepath, state.status, state.chunk_count))
+        elif state.stored_sha:
+            # Tombstones are known from the manifest: chunk ids chunk_count..old_count-1 (none if the file
+            # grew). Queued either way so _delete_ids can check that the count isn't stale.
+            self._pending_id_deletes.append((filepath, state.status, "sweep", state.chunk_count, old_count))
+        else:
+            self._commit(filepath)
+
+    def _swept(self, filepath: str, error: Optional[str]) -> None:
+        if error is None:
+            self._commit(filepath)
+        else:
+            self._record_failure(filepath, self._open_files[filepath].status, "process", error)
+            self._abandon(filepath)
+
+    def _sweep(self) -> None:
+        for start in range(0, len(self._pending_sweeps), SWEEP_FILES_PER_DELETE):
+            group = self._pending_sweeps[start:start + SWEEP_FILES_PER_DELETE]
+            try:
+                sweep_stale_chunks([(filepath, chunk_count) for filepath, _, chunk_count in group], self.repo_name)
+            except Exception as e:
+                for filepath, _, _ in group:
+                    self._swept(filepath, str(e))
+                continue
+            for filepath, _, _ in group:
+                self._swept(filepath, None)
+        self._delete_ids()
+
+    def _drop_stale_heads(self) -> None:
+        for start in range(0, len(self._stale_heads), DELETE_IDS_BATCH):
+            try:
+                delete_vector_ids(self._stale_heads[start:start + DELETE_IDS_BATCH])
+            except Exception as e:
+                print(f"[warn] Could not delete chunk 0 of partly written files: {e}")
+
+    def _settle(self, rows: List[ChunkRow], error: Optional[Exception]) -> None:
+        finished = []
+        committed = []
+        failed_here = set()
+        for row in rows:
+            state = self._open_files[row.meta.file_path]
+            if row.chunk_index == 0:
+                # The file's last write (see _commit)
+                if error is not None:
+                    self._record_failure(row.meta.file_path, state.status, "upsert", str(error))
+                committed.append((row.meta.file_path, error))
+                continue
+            state.rows_remaining -= 1
+            if error is not None and row.meta.file_path not in failed_here:
+                failed_here.add(row.meta.file_path)
+                state.failed = True
+                self._record_failure(row.meta.file_path, state.status, "upsert", str(error))
+            if state.rows_remaining == 0:
+                finished.append(row.meta.file_path)
+        for filepath in finished:
+            self._finish(filepath)
+        for filepath, head_error in committed:
+            if head_error is None:
+                self._close(filepath, self._open_files[filepath].chunk_count)
+            else:
+                self._abandon(filepath)
+
+    def _collect(self, batch: List[ChunkRow], vectors: List[dict], async_result) -> None:
+        # First attempt waits on the request already in flight; transient failures (429, 5xx, timeouts)
+        # resubmit the same vectors with backoff. Upserts overwrite by id, so a repeat is harmless.
+        attempts = iter([async_result] if async_result is not None else [])
+
+        def _attempt():
+            pending = next(attempts, None) or safe_upsert_batch(batch, self.repo_name, vectors)
+            return wait_upsert(pending, UPSERT_TIMEOUT_SECONDS)
+
+        try:
+            _call_with_backoff(_attempt, retries=PINECONE_MAX_RETRIES, initial=0.5,
+                               retryable=_is_transient, label="upsert")
+        except Exception as e:
+            if _is_transient(e):
+                self._advance(len(batch))
+                self._settle(batch, e)
+            else:
+                self._reject(batch, vectors, e)
+            return
+        self._advance(len(batch))
+        self._ids_out.writelines(row.id + "\n" for row in batch)
+        with self._stats_lock:
+            self.total_upserted += len(batch)
+        self._settle(batch, None)
+
+    def _reject(self, batch: List[ChunkRow], vectors: List[dict], error: Exception) -> None:
+        # A non-transient rejection (e.g. one malformed vector) fails only the file it came from:
+        # a batch packed from several files is resent one file at a time to find out which.
+        by_file = {}
+        for row, vector in zip(batch, vectors):
+            part = by_file.setdefault(row.meta.file_path, ([], []))
+            part[0].append(row)
+            part[1].append(vector)
+        if len(by_file) == 1:
+            self._advance(len(batch))
+            self._settle(batch, error)
+            return
+        for part_rows, part_vectors in by_file.values():
+            self._collect(part_rows, part_vectors, None)
+
+    def _drain(self, limit: int = 0) -> None:
+        while len(self._in_flight) > limit:
+            self._collect(*self._in_flight.popleft())
+
+    def _drain_all(self) -> None:
+        # Settling a request can queue chunk-0 rows (see _commit); send those too
+        while self._buffer or self._in_flight:
+            self._flush(True)
+            self._drain()
+
+    def _flush(self, final: bool) -> None:
+        batches = list(iter_batches(self._buffer, BATCH_SIZE, UPSERT_MAX_BYTES))
+        self._buffer = []
+        # Keep a trailing partial batch buffered so later files can fill it, unless told to send everything.
+        if not final and batches and len(batches[-1][0]) < BATCH_SIZE:
+            self._buffer = batches.pop()[0]
+        for rows, vectors in batches:
+            try:
+                async_result = safe_upsert_batch(rows, self.repo_name, vectors)
+            except Exception as e:
+                if not _is_transient(e):
+                    self._reject(rows, vectors, e)
+                    continue
+                async_result = None  # resubmitted with backoff when collected
+            # Requests go out (async_req) over the index's connection pool; only wait on the oldest
+            # once more than PINECONE_POOL_THREADS are outstanding.
+            self._in_flight.append((rows, vectors, async_result))
+            self._drain(PINECONE_POOL_THREADS)
+
+
+def run_sync(files_to_process: List[Tuple[str, str]], errors_out: str, repo_root: str, wipe_first: bool = False,
+             manifest_path: Optional[str] = None):
+    # Environment context - repo_name used for metadata tagging
+    github_repo = (os.getenv("GITHUB_REPOSITORY") or "").strip()
+    repo_name = github_repo.split("/")[-1] if github_repo else ""
+    if not repo_name:
+        # Local runs may not have GitHub env; fall back to the repo root directory name.
+        repo_name = Path(repo_root).resolve().name or "unknown"
+    commit_sha = os.getenv("GITHUB_SHA", "unknown")
+    # Stored on every chunk of every file; intern so all metadata dicts share one copy of each
+    repo_name = sys.intern(repo_name)
+    commit_sha = sys.intern(commit_sha)
+
+    # A file's content (and so its shebang) may have changed since a previous run in this process
+    detect_file_type.cache_clear()
+    with _token_cache_lock:
+        _token_cache_stats.update(hits=0, misses=0)
+    with _retry_stats_lock:
+        _retry_stats.clear()
+
+    # Initialize external clients and tokenizer lazily (cached across calls, see _get_index)
+    global index, tokenizer
+    index_name = os.getenv("PINECONE_INDEX", INDEX_NAME)
+    api_key = os.environ.get("PINECONE_API_KEY", "")
+
+    index = _get_index(index_name, api_key, PINECONE_POOL_THREADS)
 
     # Initialize Voyage AI embedding model via LlamaIndex
     voyage_key = os.environ.get("VOYAGE_API_KEY", "")
     if not voyage_key:
         raise RuntimeError("VOYAGE_API_KEY not set")
     global embed_model
-    embed_model = VoyageEmbedding(
-        model_name=EMBEDDING_MODEL,
-        voyage_api_key=voyage_key
-    )
-    tokenizer = tiktoken.get_encoding("cl100k_base")
+    embed_model = _get_embed_model(voyage_key)
+    tokenizer = _get_tokenizer()
 
     # Initialize LlamaChunker for unified chunking
     global chunker
-    chunker = LlamaChunker()
+    chunker = _get_chunker()
 
     print(f"[info] Starting VectorDB sync for {repo_name} (commit: {commit_sha[:8]})")
     print(f"[info] Using LlamaIndex for intelligent code-aware chunking")
@@ -895,75 +2379,60 @@ def run_sync(files_to_process: List[Tuple[str, str]], errors_out: str, repo_root
             else:
                 raise RuntimeError(f"Failed to wipe namespace: {e}")
 
-    file_stats = {"processed": 0, "errors": 0, "skipped": 0}
-    failures: List[dict] = []
-    deleted_files = 0
-    upserted_ids: List[str] = []
-    total_upserted = 0
-
-    # Process files
+    # A path listed more than once (e.g. D then A) collapses to its last status, so concurrent
+    # workers never race on the same path; the final state is what gets indexed.
+    last_status = {}
     for status, filepath in files_to_process:
+        last_status.pop(filepath, None)
+        last_status[filepath] = status
+    work = [(status, filepath) for filepath, status in last_status.items()]
+
+    # Chunk counts from earlier runs; the pipeline collects changes in manifest_updates, written once at the end
+    manifest: Dict[str, int] = load_manifest(manifest_path, index_name, repo_name) if manifest_path and not wipe_first else {}
+    pipeline = SyncPipeline(work, repo_name, commit_sha, repo_root, errors_out, manifest=manifest, wipe_first=wipe_first)
+    pipeline.run()
+    file_stats = pipeline.file_stats
+
+    if manifest_path:
+        for filepath, chunk_count in pipeline.manifest_updates.items():
+            if chunk_count is None:
+                manifest.pop(filepath, None)
+            else:
+                manifest[filepath] = chunk_count
         try:
-            path = Path(filepath)
-            if path.exists() and path.is_dir():
-                # Submodule entries can appear as paths in some diff modes; skip directories to avoid false failures.
-                file_stats["skipped"] += 1
-                append_error(errors_out, filepath, "skip-dir", "Path is a directory; skipping", status=status)
-                continue
-
-            if status == "D":
-                safe_delete_vectors(filepath, repo_name)
-                deleted_files += 1
-                continue
-
-            if not path.exists():
-                file_stats["skipped"] += 1
-                raise FileNotFoundError(f"File marked as {status} but not found: {filepath}")
-
-            if status in ("A", "M") and not wipe_first:
-                # Keep idempotency when re-chunking changes chunk counts/ids.
-                safe_delete_vectors(filepath, repo_name)
-                deleted_files += 1
-
-            chunks = process_file(filepath, status, repo_name, commit_sha)
-
-            if chunks:
-                for i in tqdm(range(0, len(chunks), BATCH_SIZE), desc=f"Upserting {filepath}", leave=False):
-                    batch = chunks[i:i + BATCH_SIZE]
-                    try:
-                        upserted_count = safe_upsert_batch(batch, repo_name)
-                        total_upserted += upserted_count
-                        for it in batch:
-                            uid = it.get('id')
-                            if isinstance(uid, str):
-                                upserted_ids.append(uid)
-                    except Exception as e:
-                        file_stats["errors"] += 1
-                        failures.append({"file_path": filepath, "operation": "upsert", "message": str(e), "status": status})
-                        append_error(errors_out, filepath, "upsert", str(e), status=status)
-
-            file_stats["processed"] += 1
+            save_manifest(manifest_path, index_name, repo_name, manifest)
         except Exception as e:
-            file_stats["errors"] += 1
-            failures.append({"file_path": filepath, "operation": "process", "message": str(e), "status": status})
-            append_error(errors_out, filepath, "process", str(e), status=status)
+            print(f"[warn] Could not write manifest {manifest_path}: {e}")
 
     print(f"\n[info] Sync Complete for {repo_name}:")
     print(f"  - Namespace: '{DEFAULT_NAMESPACE}' (default)" if DEFAULT_NAMESPACE == "" else f"  - Namespace: '{DEFAULT_NAMESPACE}'")
     print(f"  - Files processed: {file_stats['processed']}")
     print(f"  - Files skipped: {file_stats['skipped']}")
+    print(f"  - Files unchanged (not re-indexed): {file_stats['unchanged']}")
     print(f"  - Files with errors: {file_stats['errors']}")
-    print(f"  - Vectors deleted: {deleted_files} files")
-    print(f"  - Chunks upserted: {total_upserted}")
+    print(f"  - Vectors deleted: {pipeline.deleted_files} files")
+    print(f"  - Chunks upserted: {pipeline.total_upserted}")
     print(f"  - Embedding model: {EMBEDDING_MODEL}")
-    if failures:
+    token_lookups = _token_cache_stats["hits"] + _token_cache_stats["misses"]
+    if token_lookups:
+        print(f"  - Token count cache: {_token_cache_stats['hits']} hits, {_token_cache_stats['misses']} misses "
+              f"({_token_cache_stats['hits'] / token_lookups:.0%} hit rate)")
+    if _retry_stats:
+        print("  - Retries: " + ", ".join(f"{label}={count}" for label, count in sorted(_retry_stats.items())))
+    if pipeline.failures:
         print(
-            f"[error] {len(failures)} failures encountered. See {errors_out} for details. Use --retry-errors to re-run.")
-        for f in failures:
+            f"[error] {len(pipeline.failures)} failures encountered. See {errors_out} for details. Use --retry-errors to re-run.")
+        for f in pipeline.failures:
             print(
                 f"  - failure: op={f.get('operation')} status={f.get('status')} file={f.get('file_path')} message={f.get('message')}")
+    for error in pipeline.stage_errors:
+        print(f"[error] {error}")
+    if pipeline.failures or pipeline.stage_errors:
+        Path(pipeline.ids_path).unlink(missing_ok=True)
         raise SystemExit(1)
-    return {"namespace": DEFAULT_NAMESPACE, "repo_name": repo_name, "upserted_ids": upserted_ids}
+    # The caller owns the ids file: stream it with iter_upserted_ids() and delete it when done.
+    return {"namespace": DEFAULT_NAMESPACE, "repo_name": repo_name,
+            "upserted_ids_path": pipeline.ids_path, "upserted_count": pipeline.total_upserted}
 
 
 if __name__ == "__main__":